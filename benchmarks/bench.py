@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import yaml
+from aiohttp import web
+
+from benchmarks.fake_checkbox import FakeCheckbox
+from benchmarks.fake_services import FakeTelegram, FakeWorksheet
+
+CASHLESS_WORKSHEET = "cashless"
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sell and cashless transaction pipelines "
+        "against local Checkbox, Telegram and Google Sheets stand-ins.",
+    )
+    parser.add_argument("--receipts", type=int, default=200)
+    parser.add_argument("--cashiers", type=int, default=8)
+    parser.add_argument("--transactions", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--sign-delay", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--sheets-latency", type=float, default=0.1)
+    parser.add_argument("--goods", type=int, default=100)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(args)
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def write_config(checkbox_url, telegram_url):
+    config = {
+        "checkbox": {
+            "api_url": checkbox_url,
+            "pin": "0000",
+            "license": "benchmark",
+            "batch": {"threshold": 5, "concurrency": 4},
+        },
+        "telegram_bot": {
+            "token": "123456:benchmark",
+            "server": telegram_url,
+            "admins": [],
+            "rate_limit": {
+                "rate": 100000,
+                "chat_rate": 100000,
+                "chat_burst": 100000,
+            },
+        },
+        "google": {
+            "spreadsheet_key": "benchmark",
+            "worksheet": {"title_cashless": CASHLESS_WORKSHEET},
+            "flush": {"size": 10**9, "interval": 3600},
+        },
+        "privat24": {"good_name_default": "Оплата"},
+    }
+    Path("config.yaml").write_text(yaml.safe_dump(config, allow_unicode=True))
+
+
+def add_supervisor(chat_id):
+    from checkbox451_bot import auth, db
+
+    session = db.Session()
+    session.add(
+        db.User(user_id=chat_id, roles=[db.Role(name=auth.SUPERVISOR)])
+    )
+    session.commit()
+    db.Session.remove()
+    auth.RoleIndex().invalidate()
+
+
+async def bench_sell(args):
+    from checkbox451_bot import goods
+    from checkbox451_bot.checkbox_api import receipt
+    from checkbox451_bot.handlers import helpers
+
+    items = list(goods.get_items().values())
+    queue = asyncio.Queue()
+    for _ in range(args.receipts):
+        queue.put_nowait(random.choice(items))
+
+    latencies = []
+
+    async def cashier(chat_id):
+        while not queue.empty():
+            good = queue.get_nowait()
+            start = time.perf_counter()
+            receipt_id = await receipt.sell([{**good, "quantity": 1000}])
+            receipt_url = await receipt.wait_receipt_sign(receipt_id)
+            receipt_image, receipt_text = await receipt.get_receipt_extra(
+                receipt_id
+            )
+            await helpers.send_receipt(
+                chat_id, receipt_id, receipt_image, receipt_url, receipt_text
+            )
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(cashier(i) for i in range(1, args.cashiers + 1)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "receipts": len(latencies),
+        "elapsed": elapsed,
+        "receipts_per_second": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def privat24_transactions(count):
+    now = datetime.now()
+    return [
+        {
+            "TECHNICAL_TRANSACTION_ID": f"p{i}",
+            "AUT_MY_ACC": "UA000000000000000000000000000",
+            "TRANTYPE": "C",
+            "OSND": f"Плата за послуги, Платник Номер {i}",
+            "DATE_TIME_DAT_OD_TIM_P": (now - timedelta(minutes=i)).strftime(
+                "%d.%m.%Y %H:%M:%S"
+            ),
+            "SUM_E": f"{100 * random.randint(1, 20)}.00",
+        }
+        for i in range(count)
+    ]
+
+
+def fondy_transactions(count):
+    now = datetime.now()
+    return [
+        {
+            "payment_id": f"f{i}",
+            "tran_time": str(now - timedelta(minutes=i)),
+            "order_id": f"order_{i}",
+            "actual_amount": f"{100 * random.randint(1, 20)}.00",
+            "sender_email": f"payer{i}@example.com",
+            "settlement_date": str(now.date()),
+            "order_status": "approved",
+            "settlement_status": "completed",
+        }
+        for i in range(count)
+    ]
+
+
+async def bench_catch_up(processor_cls, transactions, worksheet):
+    from checkbox451_bot import db, outbox
+    from checkbox451_bot.gsheet import gsheet
+
+    class Processor(processor_cls):
+        async def get_transactions(self, start_time):
+            return transactions
+
+    processor = Processor(logger=logging.getLogger("benchmark"))
+    rows = len(worksheet.rows)
+
+    start = time.perf_counter()
+    await processor.process_transactions()
+    await gsheet.flush()
+    elapsed = time.perf_counter() - start
+
+    def done():
+        session = db.Session()
+        return (
+            session.query(db.Transaction)
+            .filter(
+                db.Transaction.type == processor.transaction_cls.type_name(),
+                db.Transaction.receipt,
+                db.Transaction.income,
+            )
+            .count()
+        )
+
+    start = time.perf_counter()
+    while await outbox.deliver_due(batch_size=100):
+        pass
+    delivery = time.perf_counter() - start
+
+    return {
+        "transactions": len(transactions),
+        "processed": await db.run(done),
+        "rows": len(worksheet.rows) - rows,
+        "catch_up": elapsed,
+        "outbox_delivery": delivery,
+    }
+
+
+async def run(args):
+    checkbox = FakeCheckbox(
+        latency=args.latency, sign_delay=args.sign_delay, goods=args.goods
+    )
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    worksheet = FakeWorksheet(latency=args.sheets_latency)
+
+    checkbox_runner, checkbox_url = await serve(checkbox.app())
+    telegram_runner, telegram_url = await serve(telegram.app())
+    write_config(checkbox_url, telegram_url)
+
+    from checkbox451_bot import goods
+    from checkbox451_bot.bot import Bot
+    from checkbox451_bot.gsheet import fondy, gsheet, privat24
+
+    gsheet._worksheets[CASHLESS_WORKSHEET] = worksheet
+    add_supervisor(1)
+
+    results = {}
+    try:
+        start = time.perf_counter()
+        await goods.load_items()
+        results["goods"] = {
+            "items": len(goods.get_items()),
+            "elapsed": time.perf_counter() - start,
+        }
+
+        results["sell"] = await bench_sell(args)
+        results["privat24"] = await bench_catch_up(
+            privat24.Privat24TransactionProcessor,
+            privat24_transactions(args.transactions),
+            worksheet,
+        )
+        results["fondy"] = await bench_catch_up(
+            fondy.FondyTransactionProcessor,
+            fondy_transactions(args.transactions),
+            worksheet,
+        )
+    finally:
+        async with Bot().session_close():
+            pass
+        await checkbox_runner.cleanup()
+        await telegram_runner.cleanup()
+
+    results["checkbox_requests"] = checkbox.requests
+    results["telegram_calls"] = dict(telegram.calls)
+    results["sheets_calls"] = worksheet.calls
+
+    return results
+
+
+def report(results):
+    sell = results["sell"]
+    print(
+        f"goods: {results['goods']['items']} items "
+        f"in {results['goods']['elapsed']:.3f}s"
+    )
+    print(
+        f"sell: {sell['receipts']} receipts in {sell['elapsed']:.2f}s, "
+        f"{sell['receipts_per_second']:.1f} receipts/s, "
+        f"p50 {sell['p50'] * 1000:.1f}ms, p99 {sell['p99'] * 1000:.1f}ms"
+    )
+    for provider in ("privat24", "fondy"):
+        catch_up = results[provider]
+        print(
+            f"{provider}: {catch_up['processed']}/{catch_up['transactions']} "
+            f"transactions, {catch_up['rows']} rows, "
+            f"catch-up {catch_up['catch_up']:.2f}s, "
+            f"outbox {catch_up['outbox_delivery']:.2f}s"
+        )
+    print(
+        f"requests: checkbox {results['checkbox_requests']}, "
+        f"telegram {sum(results['telegram_calls'].values())}, "
+        f"sheets {results['sheets_calls']}"
+    )
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
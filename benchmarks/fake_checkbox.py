@@ -0,0 +1,116 @@
+import asyncio
+import time
+import uuid
+
+from aiohttp import web
+
+PNG = (
+    b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01"
+    b"\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f"
+    b"\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82"
+)
+
+
+class FakeCheckbox:
+    def __init__(
+        self, *, latency=0.01, sign_delay=0.05, sell_delay=0, goods=100
+    ):
+        self.latency = latency
+        self.sign_delay = sign_delay
+        self.sell_delay = sell_delay
+        self.goods = [
+            {"code": f"{i:05d}", "name": f"Товар {i}", "price": 100 * i}
+            for i in range(1, goods + 1)
+        ]
+        self.receipts = {}
+        self.shift = None
+        self.requests = 0
+        self.sells = 0
+
+    @web.middleware
+    async def delay(self, request, handler):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def app(self):
+        app = web.Application(middlewares=[self.delay])
+        app.add_routes(
+            [
+                web.post("/api/v1/cashier/signinPinCode", self.sign_in),
+                web.get("/api/v1/cashier/me", self.me),
+                web.get("/api/v1/cashier/check-signature", self.signature),
+                web.get("/api/v1/cashier/shift", self.current_shift),
+                web.post("/api/v1/shifts", self.open_shift),
+                web.get("/api/v1/goods", self.goods_page),
+                web.post("/api/v1/receipts/sell", self.sell),
+                web.get("/api/v1/receipts/{id}", self.receipt),
+                web.get("/api/v1/receipts/{id}/png", self.image),
+                web.get("/api/v1/receipts/{id}/qrcode", self.image),
+                web.get("/api/v1/receipts/{id}/text", self.text),
+            ]
+        )
+        return app
+
+    async def sign_in(self, _):
+        return web.json_response(
+            {"token_type": "Bearer", "access_token": uuid.uuid4().hex}
+        )
+
+    async def me(self, _):
+        return web.json_response(
+            {"full_name": "Benchmark", "signature_type": "AGENT"}
+        )
+
+    async def signature(self, _):
+        return web.json_response({"online": True})
+
+    async def current_shift(self, _):
+        return web.json_response(self.shift)
+
+    async def open_shift(self, _):
+        self.shift = {"id": str(uuid.uuid4()), "status": "OPENED"}
+        return web.json_response({**self.shift, "status": "CREATED"})
+
+    async def goods_page(self, request):
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 25))
+        return web.json_response({"results": self.goods[offset:][:limit]})
+
+    async def sell(self, request):
+        self.sells += 1
+        data = await request.json()
+        receipt_id = data.get("id") or str(uuid.uuid4())
+        if receipt_id in self.receipts:
+            return web.json_response(
+                {"message": "Чек з таким ID вже існує"}, status=400
+            )
+
+        self.receipts[receipt_id] = time.monotonic(), data
+        await asyncio.sleep(self.sell_delay)
+        return web.json_response(
+            {"id": receipt_id, "status": "CREATED"}, status=201
+        )
+
+    def signed(self, receipt_id):
+        created, _ = self.receipts[receipt_id]
+        return time.monotonic() - created >= self.sign_delay
+
+    async def receipt(self, request):
+        receipt_id = request.match_info["id"]
+        if receipt_id not in self.receipts:
+            raise web.HTTPNotFound()
+
+        return web.json_response(
+            {
+                "id": receipt_id,
+                "status": "DONE" if self.signed(receipt_id) else "CREATED",
+                "tax_url": f"https://check.example/{receipt_id}",
+            }
+        )
+
+    async def image(self, _):
+        return web.Response(body=PNG, content_type="image/png")
+
+    async def text(self, request):
+        return web.Response(text=f"ЧЕК {request.match_info['id']}")
@@ -0,0 +1,58 @@
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, *, latency=0.01):
+        self.latency = latency
+        self.calls = Counter()
+        self.message_id = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        return app
+
+    async def method(self, request):
+        method = request.match_info["method"]
+        data = await request.post()
+
+        self.calls[method] += 1
+        self.message_id += 1
+        await asyncio.sleep(self.latency)
+
+        file_id = uuid.uuid4().hex
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": self.message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": int(data["chat_id"]), "type": "private"},
+                    "photo": [
+                        {
+                            "file_id": file_id,
+                            "file_unique_id": file_id,
+                            "width": 1,
+                            "height": 1,
+                        }
+                    ],
+                },
+            }
+        )
+
+
+class FakeWorksheet:
+    def __init__(self, *, latency=0.1):
+        self.latency = latency
+        self.rows = []
+        self.calls = 0
+
+    async def append_rows(self, rows, **_):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        self.rows.extend(rows)
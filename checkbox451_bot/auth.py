@@ -1,7 +1,8 @@
+from collections import defaultdict
 from enum import Enum, unique
 from functools import lru_cache, wraps
 from logging import getLogger
-from typing import Union
+from typing import Dict, Set, Union
 
 from aiogram.types import CallbackQuery, Contact, Message
 from sqlalchemy_utils import PhoneNumber
@@ -63,7 +64,7 @@ def require(role_name):
             if has_role(message.from_user.id, role_name):
                 return await handler(message)
 
-            if SignMode.enabled() or not get_role(ADMIN).users:
+            if SignMode.enabled() or not role_users(ADMIN):
                 await Bot().send_message(
                     message.from_user.id,
                     "Потрібна авторизація",
@@ -106,13 +107,15 @@ def add_role(user: db.User, role_name: str, *, session: db.Session):
     log.info("%s is a %s now", user.user_id, role.name)
 
     session.commit()
+    RoleIndex().invalidate()
 
 
 def sign_in(contact: Contact):
     session = db.Session()
 
-    if SignMode.enabled() or not get_role(ADMIN, session=session).users:
+    if SignMode.enabled() or not role_users(ADMIN):
         user = add_user(contact, session=session)
+        RoleIndex().invalidate()
 
         if SignMode.one():
             SignMode.set(SignMode.OFF)
@@ -123,12 +126,48 @@ def sign_in(contact: Contact):
         return user
 
 
+@lru_cache(maxsize=1)
+class RoleIndex:
+    def __init__(self):
+        self._user_roles: Dict[int, Set[str]] = {}
+        self._role_users: Dict[str, Set[int]] = {}
+        self._loaded = False
+
+    def load(self, *, session: db.Session = None):
+        session = session or db.Session()
+
+        user_roles = defaultdict(set)
+        role_users = defaultdict(set)
+        for user_id, role_name in session.query(
+            db.association_table.c.user_id,
+            db.association_table.c.role_name,
+        ):
+            user_roles[user_id].add(role_name)
+            role_users[role_name].add(user_id)
+
+        self._user_roles = dict(user_roles)
+        self._role_users = dict(role_users)
+        self._loaded = True
+
+        log.info("roles loaded: %s", self._role_users)
+
+    def invalidate(self):
+        self._loaded = False
+
+    def user_roles(self, user_id) -> Set[str]:
+        if not self._loaded:
+            self.load()
+        return self._user_roles.get(int(user_id), set())
+
+    def role_users(self, role_name) -> Set[int]:
+        if not self._loaded:
+            self.load()
+        return self._role_users.get(role_name, set())
+
+
 def has_role(user_id, role_name):
-    session = db.Session()
-    user = (
-        session.query(db.User)
-        .filter(db.User.user_id == user_id, db.User.roles.any(name=role_name))
-        .one_or_none()
-    )
+    return role_name in RoleIndex().user_roles(user_id)
 
-    return user
+
+def role_users(role_name):
+    return list(RoleIndex().role_users(role_name))
@@ -2,9 +2,22 @@ from contextlib import asynccontextmanager
 from functools import lru_cache
 
 from aiogram import Bot as TelegramBot
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.types import ParseMode
+from aiogram.utils import json
+from aiohttp import ClientSession
 
+from checkbox451_bot import metrics
+from checkbox451_bot.checkbox_api.helpers import close_client_session
 from checkbox451_bot.config import Config
+from checkbox451_bot.ratelimit import limiter
+
+
+def server():
+    if base := Config().get("telegram_bot", "server"):
+        return TelegramAPIServer.from_base(base)
+
+    return TELEGRAM_PRODUCTION
 
 
 @lru_cache(maxsize=1)
@@ -13,6 +26,25 @@ class Bot(TelegramBot):
         super().__init__(
             Config().get("telegram_bot", "token", required=True),
             parse_mode=ParseMode.HTML,
+            server=server(),
+        )
+
+    async def request(self, method, data=None, *args, **kwargs):
+        if (
+            method.startswith(("send", "forward", "copy"))
+            and method != "sendChatAction"
+            and data
+            and "chat_id" in data
+        ):
+            await limiter().acquire(data["chat_id"])
+
+        return await super().request(method, data, *args, **kwargs)
+
+    async def get_new_session(self):
+        return ClientSession(
+            connector=self._connector_class(**self._connector_init),
+            json_serialize=json.dumps,
+            trace_configs=[metrics.trace_config("telegram")],
         )
 
     @asynccontextmanager
@@ -21,3 +53,4 @@ class Bot(TelegramBot):
             yield
         finally:
             await (await self.get_session()).close()
+            await close_client_session()
@@ -1,41 +1,95 @@
+import asyncio
+from functools import lru_cache
 from logging import getLogger
-
-import cachetools.func
-import requests
+from typing import Optional
 
 from checkbox451_bot.config import Config
+from checkbox451_bot.tracing import detached, traced
 
 log = getLogger(__name__)
 
 
-@cachetools.func.ttl_cache(ttl=86400)
-def sign_in():
-    from checkbox451_bot.checkbox_api.helpers import endpoint, headers
+@lru_cache(maxsize=1)
+class TokenManager:
+    ttl = 86400
+    refresh_margin = 3600
+
+    def __init__(self):
+        self._authorization: Optional[str] = None
+        self._expires_at = 0.0
+        self._pending: Optional[asyncio.Future] = None
+
+    async def get(self, *, force=False):
+        now = asyncio.get_running_loop().time()
+
+        if self._authorization and not force:
+            if now < self._expires_at - self.refresh_margin:
+                return self._authorization
+
+            if now < self._expires_at:
+                self._refresh()
+                return self._authorization
+
+        return await asyncio.shield(self._refresh())
+
+    def _refresh(self):
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.ensure_future(detached(self._sign_in()))
+            self._pending.add_done_callback(self._on_sign_in)
+
+        return self._pending
+
+    def _on_sign_in(self, future: asyncio.Future):
+        if future.cancelled():
+            return
+
+        if err := future.exception():
+            log.error("sign in failed: %r", err)
+
+    @traced()
+    async def _sign_in(self):
+        from checkbox451_bot.checkbox_api.helpers import (
+            client_session,
+            endpoint,
+            headers,
+        )
+
+        pin_code = Config().get("checkbox", "pin", required=True)
+
+        session = client_session()
+        async with session.post(
+            endpoint("/cashier/signinPinCode"),
+            headers=await headers(auth=False, lic=True),
+            json=dict(pin_code=pin_code),
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+
+        authorization = f"{data['token_type']} {data['access_token']}"
+
+        me_headers = await headers(auth=False)
+        me_headers["Authorization"] = authorization
+        async with session.get(
+            endpoint("/cashier/me"), headers=me_headers
+        ) as response:
+            response.raise_for_status()
+            me = await response.json()
 
-    pin_code = Config().get("checkbox", "pin", required=True)
+        log.info("signed in: %s (%s)", me["full_name"], me["signature_type"])
 
-    url = endpoint("/cashier/signinPinCode")
-    r = requests.post(
-        url,
-        headers=headers(auth=False, lic=True),
-        json=dict(pin_code=pin_code),
-    )
-    r.raise_for_status()
-    data = r.json()
+        self._authorization = authorization
+        self._expires_at = asyncio.get_running_loop().time() + self.ttl
 
-    authorization = f"{data['token_type']} {data['access_token']}"
+        return authorization
 
-    me_url = endpoint("/cashier/me")
-    me_headers = headers(auth=False)
-    me_headers["Authorization"] = authorization
-    me_req = requests.get(me_url, headers=me_headers)
-    me_req.raise_for_status()
-    me = me_req.json()
+    def clear(self):
+        self._authorization = None
+        self._expires_at = 0.0
 
-    log.info("signed in: %s (%s)", me["full_name"], me["signature_type"])
 
-    return authorization
+async def sign_in(*, force=False):
+    return await TokenManager().get(force=force)
 
 
 def sign_out():
-    sign_in.cache_clear()
+    TokenManager().clear()
@@ -1,5 +1,7 @@
 class CheckboxAPIError(Exception):
-    pass
+    def __init__(self, *args, status=None):
+        super().__init__(*args)
+        self.status = status
 
 
 class CheckboxSignError(CheckboxAPIError):
@@ -12,3 +14,7 @@ class CheckboxReceiptError(CheckboxAPIError):
 
 class CheckboxShiftError(CheckboxAPIError):
     pass
+
+
+class CheckboxUnavailableError(CheckboxAPIError):
+    pass
@@ -1,13 +1,52 @@
+from http import HTTPStatus
 from operator import itemgetter
 
-import requests
+from checkbox451_bot.checkbox_api.helpers import aiohttp_session, get_retry
+from checkbox451_bot.tracing import traced
 
-from checkbox451_bot.checkbox_api.helpers import endpoint, headers
+_pages = {}
 
 
-def goods():
-    url = endpoint("/goods")
-    r = requests.get(url, headers=headers())
-    r.raise_for_status()
-    j = r.json()
-    return sorted(j["results"], key=itemgetter("code"))
+def page_loader(offset):
+    async def loader(response):
+        if response.status == HTTPStatus.NOT_MODIFIED:
+            return _pages[offset][1]
+
+        page = await response.json()
+        if etag := response.headers.get("ETag"):
+            _pages[offset] = etag, page
+        else:
+            _pages.pop(offset, None)
+        return page
+
+    return loader
+
+
+@traced()
+@aiohttp_session
+async def goods(*, session, limit=100):
+    results = []
+    offset = 0
+    while True:
+        extra_headers = {}
+        if offset in _pages:
+            extra_headers["If-None-Match"] = _pages[offset][0]
+
+        page = await get_retry(
+            "/goods",
+            session=session,
+            loader=page_loader(offset),
+            extra_headers=extra_headers,
+            offset=offset,
+            limit=limit,
+        )
+        results.extend(page["results"])
+
+        if len(page["results"]) < limit:
+            break
+        offset += limit
+
+    for stale in [key for key in _pages if key > offset]:
+        del _pages[stale]
+
+    return sorted(results, key=itemgetter("code"))
@@ -1,50 +1,83 @@
 import asyncio
 import posixpath
-from functools import wraps
+import time
+from functools import lru_cache, wraps
+from http import HTTPStatus
 from json import JSONDecodeError
 from logging import getLogger
-from typing import Type
+from typing import Any, Callable, Dict, Hashable, Optional, Type
 
 import aiohttp
 from aiohttp import ClientResponse, ClientSession, ClientTimeout
+from cachetools import TTLCache
 
 import checkbox451_bot
-from checkbox451_bot.checkbox_api.auth import sign_in
+from checkbox451_bot import metrics
+from checkbox451_bot.checkbox_api.auth import sign_in, sign_out
 from checkbox451_bot.checkbox_api.exceptions import (
     CheckboxAPIError,
     CheckboxSignError,
 )
+from checkbox451_bot.checkbox_api.retry import breaker, retry_policy
 from checkbox451_bot.config import Config
+from checkbox451_bot.tracing import annotate, detached, traced
 
 log = getLogger(__name__)
 
 api_url = "https://api.checkbox.ua/"
 
+_client_session: Optional[ClientSession] = None
+
+
+def client_session():
+    global _client_session
+
+    if _client_session is None or _client_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=Config().get("checkbox", "pool", "limit", default=100),
+            limit_per_host=Config().get(
+                "checkbox", "pool", "limit_per_host", default=10
+            ),
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        _client_session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[metrics.trace_config("checkbox")],
+        )
+
+    return _client_session
+
+
+async def close_client_session():
+    global _client_session
+
+    if _client_session is not None:
+        await _client_session.close()
+        _client_session = None
+
 
 def aiohttp_session(func):
     @wraps(func)
     async def wrapper(*args, session=None, **kwargs):
-        if session:
-            return await func(*args, session=session, **kwargs)
-
-        async with aiohttp.ClientSession() as session:
-            return await func(*args, session=session, **kwargs)
+        return await func(*args, session=session or client_session(), **kwargs)
 
     return wrapper
 
 
 def endpoint(path: str):
-    return posixpath.join(api_url, "api/v1", path.lstrip("/"))
+    base_url = Config().get("checkbox", "api_url", default=api_url)
+    return posixpath.join(base_url, "api/v1", path.lstrip("/"))
 
 
-def headers(*, auth=True, lic=False):
+async def headers(*, auth=True, lic=False):
     _headers = {
         "X-Client-Name": checkbox451_bot.__appname__,
         "X-Client-Version": checkbox451_bot.__version__,
     }
 
     if auth:
-        _headers["Authorization"] = sign_in()
+        _headers["Authorization"] = await sign_in()
 
     if lic:
         _headers["X-License-Key"] = Config().get(
@@ -54,57 +87,120 @@ def headers(*, auth=True, lic=False):
     return _headers
 
 
-async def get_retry(
+async def _request(
+    method,
     path,
     *,
     session: ClientSession,
+    exc,
+    retry,
+    lic=False,
+    timeout=None,
+    extra_headers=None,
     loader="json",
-    exc=CheckboxAPIError,
     **kwargs,
 ):
     url = endpoint(path)
+    annotate(path=path)
+
+    policy = retry_policy()
+    circuit = breaker(url)
+    circuit.check()
+    policy.deposit()
+
+    def can_retry():
+        return (
+            retry
+            and attempt + 1 < policy.attempts
+            and not circuit.is_open
+            and policy.withdraw()
+        )
 
-    err = exc("Невідома помилка")
-    response = None
-    for attempt in range(6):
+    attempt = 0
+    reauth = True
+    while True:
         try:
-            async with session.get(
+            async with session.request(
+                method,
                 url,
-                headers=headers(),
-                params=kwargs,
-                timeout=ClientTimeout(total=0.5 * 1.5**attempt),
+                headers={**await headers(lic=lic), **(extra_headers or {})},
+                timeout=ClientTimeout(
+                    total=timeout or policy.timeout(attempt)
+                ),
+                **kwargs,
             ) as response:
+                if response.status == HTTPStatus.UNAUTHORIZED and reauth:
+                    reauth = False
+                    sign_out()
+                    metrics.retry("checkbox", url)
+                    continue
+
                 if response.status < 500:
+                    circuit.success()
                     return await check_response(
                         response, loader=loader, exc=exc
                     )
-        except asyncio.TimeoutError as e:
-            err = e
-        log.warning("retry attempt: %s (%s)", attempt + 1, path)
-        await asyncio.sleep(1)
 
-    if response:
-        await raise_on_error(response, exc)
+                if not can_retry():
+                    circuit.failure()
+                    await raise_on_error(response, exc)
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            if not can_retry():
+                circuit.failure()
+                raise
 
-    raise err
+        attempt += 1
+        log.warning("retry attempt: %s (%s)", attempt, path)
+        annotate(retries=attempt)
+        metrics.retry("checkbox", url)
+        await asyncio.sleep(policy.delay(attempt))
 
 
+@traced()
+@aiohttp_session
+async def get_retry(
+    path,
+    *,
+    session: ClientSession,
+    loader="json",
+    exc=CheckboxAPIError,
+    extra_headers=None,
+    **kwargs,
+):
+    return await _request(
+        "GET",
+        path,
+        session=session,
+        exc=exc,
+        retry=True,
+        extra_headers=extra_headers,
+        loader=loader,
+        params=kwargs,
+    )
+
+
+@traced()
+@aiohttp_session
 async def post(
     path,
     *,
     session: ClientSession,
     lic=False,
     exc=CheckboxAPIError,
+    idempotent=False,
+    timeout=None,
     **kwargs,
 ):
-    url = endpoint(path)
-    async with session.post(
-        url, headers=headers(lic=lic), json=kwargs
-    ) as response:
-        if response.ok:
-            return await response.json()
-
-        await raise_on_error(response, exc)
+    return await _request(
+        "POST",
+        path,
+        session=session,
+        exc=exc,
+        retry=idempotent,
+        lic=lic,
+        timeout=timeout or retry_policy().post_timeout,
+        json=kwargs,
+    )
 
 
 async def raise_on_error(
@@ -116,13 +212,13 @@ async def raise_on_error(
     try:
         result = await response.json()
     except Exception as e:
-        raise exc(response.reason) from e
+        raise exc(response.reason, status=response.status) from e
 
     message = result["message"]
     if detail := result.get("detail"):
         message += f": {detail}"
 
-    raise exc(message)
+    raise exc(message, status=response.status)
 
 
 async def check_response(
@@ -132,6 +228,8 @@ async def check_response(
     exc: Type[CheckboxAPIError] = CheckboxAPIError,
 ):
     if response.ok:
+        if callable(loader):
+            return await loader(response)
         return await getattr(response, loader)()
 
     await raise_on_error(response, exc)
@@ -155,7 +253,119 @@ async def raise_for_status(response: ClientResponse):
     response.raise_for_status()
 
 
+async def gather_within(*aws, timeout):
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+
+    for task in pending:
+        task.cancel()
+
+    return [
+        (
+            asyncio.TimeoutError()
+            if task in pending
+            else task.exception() or task.result()
+        )
+        for task in tasks
+    ]
+
+
+_status_polls: Dict[Hashable, asyncio.Future] = {}
+
+
+async def _poll_status(
+    path,
+    predicate: Callable[[Any], bool],
+    *,
+    session: ClientSession,
+    exc,
+    timeout,
+    default,
+    delay,
+    max_delay,
+):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    result = default
+    while (remaining := deadline - loop.time()) > 0:
+        try:
+            result = await asyncio.wait_for(
+                get_retry(path, session=session, exc=exc), remaining
+            )
+        except JSONDecodeError:
+            pass
+        except asyncio.TimeoutError:
+            break
+        else:
+            if predicate(result):
+                break
+
+        await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+        delay = min(delay * 2, max_delay)
+
+    return result
+
+
+@traced()
+@aiohttp_session
+async def wait_status(
+    path,
+    predicate: Callable[[Any], bool],
+    *,
+    session: ClientSession,
+    exc=CheckboxAPIError,
+    timeout=10,
+    default=None,
+    delay=0.1,
+    max_delay=2,
+):
+    key = path, predicate
+    if (poll := _status_polls.get(key)) is None:
+        poll = _status_polls[key] = asyncio.ensure_future(
+            detached(
+                _poll_status(
+                    path,
+                    predicate,
+                    session=session,
+                    exc=exc,
+                    timeout=timeout,
+                    default=default,
+                    delay=delay,
+                    max_delay=max_delay,
+                )
+            )
+        )
+        poll.add_done_callback(lambda _: _status_polls.pop(key, None))
+
+    return await asyncio.shield(poll)
+
+
+@lru_cache(maxsize=1)
+def state():
+    return TTLCache(
+        maxsize=8, ttl=Config().get("checkbox", "state_ttl", default=30)
+    )
+
+
+def invalidate_state(*keys):
+    for key in keys or list(state()):
+        state().pop(key, None)
+
+
+async def timed(timings: Dict[str, float], name, aw):
+    start = time.perf_counter()
+    try:
+        return await aw
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+@traced()
 async def check_sign(*, session):
+    if state().get("sign"):
+        return True
+
     try:
         result = await get_retry(
             "/cashier/check-signature", session=session, exc=CheckboxSignError
@@ -163,7 +373,10 @@ async def check_sign(*, session):
     except JSONDecodeError:
         return False
 
-    return result["online"]
+    if online := result["online"]:
+        state()["sign"] = True
+
+    return online
 
 
 def require_sign(func):
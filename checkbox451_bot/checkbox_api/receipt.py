@@ -1,25 +1,63 @@
 import asyncio
 from functools import lru_cache
-from json.decoder import JSONDecodeError
+from http import HTTPStatus
 from logging import getLogger
+from uuid import uuid4
 
-from checkbox451_bot.checkbox_api.exceptions import CheckboxReceiptError
+import aiohttp
+
+from checkbox451_bot.checkbox_api.exceptions import (
+    CheckboxReceiptError,
+    CheckboxSignError,
+)
 from checkbox451_bot.checkbox_api.helpers import (
     aiohttp_session,
+    check_sign,
+    gather_within,
     get_retry,
+    invalidate_state,
     post,
-    require_sign,
+    timed,
+    wait_status,
 )
-from checkbox451_bot.checkbox_api.shift import current_shift, open_shift
+from checkbox451_bot.checkbox_api.retry import retry_policy
+from checkbox451_bot.checkbox_api.shift import ensure_shift, shift_is_open
 from checkbox451_bot.config import Config
+from checkbox451_bot.tracing import traced
 
 log = getLogger(__name__)
 
 
+@traced()
+@aiohttp_session
+async def find_receipt(receipt_id, *, session):
+    try:
+        return await get_retry(
+            f"/receipts/{receipt_id}",
+            session=session,
+            exc=CheckboxReceiptError,
+        )
+    except CheckboxReceiptError as e:
+        if e.status == HTTPStatus.NOT_FOUND:
+            return None
+        raise
+
+
+async def receipt_exists(receipt_id, *, session):
+    try:
+        return await find_receipt(receipt_id, session=session) is not None
+    except Exception as e:
+        log.warning("receipt lookup failed: %s: %r", receipt_id, e)
+        return False
+
+
+@traced()
 @aiohttp_session
-async def create_receipt(goods, cashless=False, *, session):
+async def create_receipt(goods, cashless=False, *, session, receipt_id=None):
+    receipt_id = receipt_id or str(uuid4())
     payment = sum(good["price"] * good["quantity"] / 1000 for good in goods)
     data = {
+        "id": receipt_id,
         "goods": [
             {
                 "good": good,
@@ -35,37 +73,53 @@ async def create_receipt(goods, cashless=False, *, session):
         ],
     }
 
-    receipt = await post(
-        "/receipts/sell", session=session, exc=CheckboxReceiptError, **data
-    )
+    try:
+        await post(
+            "/receipts/sell",
+            session=session,
+            exc=CheckboxReceiptError,
+            idempotent=True,
+            timeout=retry_policy().sell_timeout,
+            **data,
+        )
+    except (
+        CheckboxReceiptError,
+        asyncio.TimeoutError,
+        aiohttp.ClientConnectionError,
+    ) as err:
+        if not await receipt_exists(receipt_id, session=session):
+            raise err
+        log.info("receipt reconciled: %s", receipt_id)
 
-    receipt_id = receipt["id"]
     log.info("receipt: %s", receipt_id)
     return receipt_id
 
 
+def receipt_signed(receipt):
+    return isinstance(receipt, dict) and receipt["status"] in {
+        "DONE",
+        "SIGNED",
+    }
+
+
+@traced()
 @aiohttp_session
 async def wait_receipt_sign(receipt_id, *, session):
-    receipt = receipt_id
-    for _ in range(10):
-        try:
-            receipt = await get_retry(
-                f"/receipts/{receipt_id}",
-                session=session,
-                exc=CheckboxReceiptError,
-            )
-        except JSONDecodeError:
-            pass
-        else:
-            if receipt["status"] in {"DONE", "SIGNED"}:
-                return receipt["tax_url"]
-
-        await asyncio.sleep(1)
+    receipt = await wait_status(
+        f"/receipts/{receipt_id}",
+        receipt_signed,
+        session=session,
+        exc=CheckboxReceiptError,
+        default=receipt_id,
+    )
+    if receipt_signed(receipt):
+        return receipt["tax_url"]
 
     log.error("receipt signing error: %s", receipt)
     raise CheckboxReceiptError("Не вдалось підписати чек")
 
 
+@traced()
 async def get_receipt_png(receipt_id, *, session):
     png = await get_retry(
         f"/receipts/{receipt_id}/png",
@@ -77,6 +131,7 @@ async def get_receipt_png(receipt_id, *, session):
     return png
 
 
+@traced()
 async def get_receipt_qrcode(receipt_id, *, session):
     qrcode = await get_retry(
         f"/receipts/{receipt_id}/qrcode",
@@ -88,6 +143,7 @@ async def get_receipt_qrcode(receipt_id, *, session):
     return qrcode
 
 
+@traced()
 async def get_receipt_text(receipt_id, *, session):
     receipt_text = await get_retry(
         f"/receipts/{receipt_id}/text",
@@ -100,48 +156,141 @@ async def get_receipt_text(receipt_id, *, session):
     return receipt_text
 
 
+@traced()
 @aiohttp_session
-async def get_receipt_extra(receipt_id, *, session):
+async def get_receipt_extra(receipt_id, *, session, timeout=20):
     if Config().get("receipt_as_image"):
-        receipt_image = await get_receipt_png(receipt_id, session=session)
+        receipt_image = await asyncio.wait_for(
+            get_receipt_png(receipt_id, session=session), timeout
+        )
+        return receipt_image, None
+
+    receipt_image, receipt_text = await gather_within(
+        get_receipt_qrcode(receipt_id, session=session),
+        get_receipt_text(receipt_id, session=session),
+        timeout=timeout,
+    )
+
+    if isinstance(receipt_image, Exception):
+        raise receipt_image
+
+    if isinstance(receipt_text, Exception):
+        log.warning("receipt text error: %r", receipt_text)
         receipt_text = None
-    else:
-        receipt_image = await get_receipt_qrcode(receipt_id, session=session)
-        receipt_text = await get_receipt_text(receipt_id, session=session)
 
     return receipt_image, receipt_text
 
 
+@traced()
 @aiohttp_session
-@require_sign
-async def sell(goods, cashless=False, *, session):
+async def sell(goods, cashless=False, *, session, receipt_id=None):
     if any(good["price"] <= 0 for good in goods):
         raise ValueError("Невірна ціна")
     if any(good["quantity"] <= 0 for good in goods):
         raise ValueError("Невірна кількість")
 
-    if not await current_shift(session=session):
-        await open_shift(session=session)
+    timings = {}
+    try:
+        signed, shift_opened = await asyncio.gather(
+            timed(timings, "check_sign", check_sign(session=session)),
+            timed(timings, "shift", shift_is_open(session=session)),
+        )
+        if not signed:
+            raise CheckboxSignError("Підпис недоступний")
+
+        if not shift_opened:
+            await timed(timings, "open_shift", ensure_shift(session=session))
+
+        receipt_id = await timed(
+            timings,
+            "create_receipt",
+            create_receipt(
+                goods,
+                cashless=cashless,
+                session=session,
+                receipt_id=receipt_id,
+            ),
+        )
+    except Exception:
+        invalidate_state()
+        raise
+    finally:
+        log.info("sell timings: %s", timings)
 
-    receipt_id = await create_receipt(
-        goods, cashless=cashless, session=session
-    )
     return receipt_id
 
 
+@traced()
 @aiohttp_session
-async def get_receipt_data(receipt_id, *, session):
-    receipt = await get_retry(
-        f"/receipts/{receipt_id}", session=session, exc=CheckboxReceiptError
+async def sell_batch(
+    goods_list,
+    cashless=False,
+    *,
+    session,
+    concurrency=4,
+    receipt_ids=None,
+):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sell_one(goods, receipt_id):
+        async with semaphore:
+            return await sell(
+                goods,
+                cashless=cashless,
+                session=session,
+                receipt_id=receipt_id,
+            )
+
+    return await asyncio.gather(
+        *(
+            sell_one(goods, receipt_id)
+            for goods, receipt_id in zip(
+                goods_list, receipt_ids or [None] * len(goods_list)
+            )
+        ),
+        return_exceptions=True,
     )
-    receipt_url = receipt.get("tax_url")
-    receipt_image, receipt_text = await get_receipt_extra(
-        receipt_id, session=session
+
+
+@traced()
+@aiohttp_session
+async def wait_receipts_sign(receipt_ids, *, session):
+    return await asyncio.gather(
+        *(
+            wait_receipt_sign(receipt_id, session=session)
+            for receipt_id in receipt_ids
+        ),
+        return_exceptions=True,
     )
 
+
+@traced()
+@aiohttp_session
+async def get_receipt_data(receipt_id, *, session, timeout=20):
+    receipt, extra = await gather_within(
+        get_retry(
+            f"/receipts/{receipt_id}",
+            session=session,
+            exc=CheckboxReceiptError,
+        ),
+        get_receipt_extra(receipt_id, session=session, timeout=timeout),
+        timeout=timeout,
+    )
+
+    if isinstance(extra, Exception):
+        raise extra
+    receipt_image, receipt_text = extra
+
+    if isinstance(receipt, Exception):
+        log.warning("receipt error: %r", receipt)
+        receipt_url = None
+    else:
+        receipt_url = receipt.get("tax_url")
+
     return receipt_image, receipt_url, receipt_text
 
 
+@traced()
 @aiohttp_session
 async def search_receipt(fiscal_code, *, session):
     results = (
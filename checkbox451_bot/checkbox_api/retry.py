@@ -0,0 +1,121 @@
+import random
+import time
+from functools import lru_cache
+from logging import getLogger
+from typing import Dict, Optional
+
+from yarl import URL
+
+from checkbox451_bot import metrics
+from checkbox451_bot.checkbox_api.exceptions import CheckboxUnavailableError
+from checkbox451_bot.config import Config
+
+log = getLogger(__name__)
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        *,
+        attempts=6,
+        timeout=0.5,
+        timeout_factor=1.5,
+        post_timeout=30,
+        sell_timeout=5,
+        backoff=0.2,
+        max_backoff=5,
+        budget=10,
+        budget_ratio=0.2,
+    ):
+        self.attempts = attempts
+        self.base_timeout = timeout
+        self.timeout_factor = timeout_factor
+        self.post_timeout = post_timeout
+        self.sell_timeout = sell_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        self._tokens = budget
+
+    def timeout(self, attempt):
+        return self.base_timeout * self.timeout_factor**attempt
+
+    def delay(self, attempt):
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2**attempt)
+        )
+
+    def deposit(self):
+        self._tokens = min(self.budget, self._tokens + self.budget_ratio)
+
+    def withdraw(self):
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    def __init__(self, name, *, threshold=5, reset_timeout=30):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def check(self):
+        if self.opened_at is None:
+            return
+
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            raise CheckboxUnavailableError("Checkbox тимчасово недоступний")
+
+        self.opened_at = time.monotonic()
+        log.info("circuit half-open: %s", self.name)
+
+    def success(self):
+        if self.opened_at is not None:
+            log.info("circuit closed: %s", self.name)
+
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                log.warning("circuit open: %s", self.name)
+            self.opened_at = time.monotonic()
+
+
+@lru_cache(maxsize=1)
+def retry_policy():
+    return RetryPolicy(**(Config().get("checkbox", "retry") or {}))
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(url):
+    name = metrics.endpoint_name(URL(url).path)
+    if (circuit := _breakers.get(name)) is None:
+        circuit = _breakers[name] = CircuitBreaker(
+            name, **(Config().get("checkbox", "breaker") or {})
+        )
+
+    return circuit
+
+
+metrics.register(
+    metrics.Gauges(
+        "checkbox_circuit_open",
+        "Open Checkbox circuit breakers",
+        lambda: {name: int(c.is_open) for name, c in _breakers.items()},
+    )
+)
@@ -1,5 +1,5 @@
 import asyncio
-from json.decoder import JSONDecodeError
+from functools import lru_cache
 
 from checkbox451_bot.checkbox_api.auth import sign_out
 from checkbox451_bot.checkbox_api.exceptions import (
@@ -9,12 +9,34 @@ from checkbox451_bot.checkbox_api.exceptions import (
 from checkbox451_bot.checkbox_api.helpers import (
     aiohttp_session,
     get_retry,
+    invalidate_state,
     log,
     post,
     require_sign,
+    state,
+    wait_status,
 )
+from checkbox451_bot.tracing import traced
 
 
+@lru_cache(maxsize=1)
+def _open_lock():
+    return asyncio.Lock()
+
+
+def shift_opened(shift):
+    return bool(shift) and shift["status"] == "OPENED"
+
+
+def shift_closed(shift):
+    return shift is None
+
+
+def service_out_done(receipt):
+    return isinstance(receipt, dict) and receipt["status"] == "DONE"
+
+
+@traced()
 @aiohttp_session
 async def current_shift(*, session):
     result = await get_retry(
@@ -24,27 +46,44 @@ async def current_shift(*, session):
     return result
 
 
+@traced()
+async def shift_is_open(*, session):
+    if state().get("shift"):
+        return True
+
+    if shift := await current_shift(session=session):
+        state()["shift"] = True
+
+    return bool(shift)
+
+
+@traced()
+async def ensure_shift(*, session):
+    async with _open_lock():
+        if not await shift_is_open(session=session):
+            await open_shift(session=session)
+            state()["shift"] = True
+
+
+@traced()
 @aiohttp_session
 async def open_shift(*, session):
     opened_shift = await post(
         "/shifts", session=session, lic=True, exc=CheckboxShiftError
     )
 
-    shift = opened_shift
-    for _ in range(60):
-        try:
-            shift = await get_retry(
-                "/cashier/shift", session=session, exc=CheckboxShiftError
-            )
-        except JSONDecodeError:
-            pass
-        else:
-            if shift and shift["status"] == "OPENED":
-                shift_id = shift["id"]
-                log.info("shift: %s", shift_id)
-                return shift_id
-
-        await asyncio.sleep(1)
+    shift = await wait_status(
+        "/cashier/shift",
+        shift_opened,
+        session=session,
+        exc=CheckboxShiftError,
+        timeout=60,
+        default=opened_shift,
+    )
+    if shift_opened(shift):
+        shift_id = shift["id"]
+        log.info("shift: %s", shift_id)
+        return shift_id
 
     if shift is None:
         log.warning("shift is missing: %s", opened_shift)
@@ -53,6 +92,7 @@ async def open_shift(*, session):
     raise CheckboxShiftError("Не вдалось підписати зміну")
 
 
+@traced()
 @aiohttp_session
 async def service_out(*, session):
     shift = await current_shift(session=session)
@@ -80,28 +120,25 @@ async def service_out(*, session):
     receipt_id = receipt["id"]
     log.info("service out: %s", receipt_id)
 
-    for _ in range(10):
-        try:
-            receipt = await get_retry(
-                f"/receipts/{receipt_id}",
-                session=session,
-                exc=CheckboxReceiptError,
-            )
-        except JSONDecodeError:
-            pass
-        else:
-            if receipt["status"] == "DONE":
-                return receipt_id
-
-        await asyncio.sleep(1)
+    receipt = await wait_status(
+        f"/receipts/{receipt_id}",
+        service_out_done,
+        session=session,
+        exc=CheckboxReceiptError,
+        default=receipt,
+    )
+    if service_out_done(receipt):
+        return receipt_id
 
     log.error("service out signing error: %s", receipt)
     raise CheckboxReceiptError("Не вдалось підписати службову видачу")
 
 
+@traced()
 @aiohttp_session
 @require_sign
 async def shift_close(*, session):
+    invalidate_state("shift")
     await service_out(session=session)
 
     shift = await post(
@@ -111,20 +148,19 @@ async def shift_close(*, session):
     shift_id = shift["id"]
     cash_profit = shift["balance"]["service_out"] / 100
 
-    for _ in range(60):
-        try:
-            shift = await get_retry(
-                "/cashier/shift", session=session, exc=CheckboxShiftError
-            )
-        except JSONDecodeError:
-            pass
-        else:
-            if shift is None:
-                log.info("shift closed: %s", shift_id)
-                sign_out()
-                return cash_profit
-
-        await asyncio.sleep(1)
+    shift = await wait_status(
+        "/cashier/shift",
+        shift_closed,
+        session=session,
+        exc=CheckboxShiftError,
+        timeout=60,
+        default=shift,
+    )
+    if shift_closed(shift):
+        log.info("shift closed: %s", shift_id)
+        invalidate_state()
+        sign_out()
+        return cash_profit
 
     log.error("shift close error: %s", shift)
     raise CheckboxShiftError("Не вдалось підписати закриття зміни")
@@ -1,16 +1,21 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
 from typing import TYPE_CHECKING
 
 from aiogram.types import Contact
 from sqlalchemy import (
+    JSON,
     Boolean,
     Column,
     DateTime,
     ForeignKey,
     Integer,
+    LargeBinary,
     String,
     Table,
     create_engine,
+    event,
     false,
 )
 from sqlalchemy.ext.declarative import declarative_base
@@ -79,10 +84,80 @@ class Transaction(Base):
     income = Column(Boolean, server_default=false())
 
 
+class Receipt(Base):
+    __tablename__ = "receipts"
+
+    id = Column(String(36), primary_key=True)
+    status = Column(String(16))
+    goods = Column(JSON)
+    cashless = Column(Boolean)
+    created = Column(DateTime)
+    transaction_type = Column(String(16))
+    transaction_id = Column(String(20), index=True)
+    chat_id = Column(Integer)
+    attempts = Column(Integer, default=0)
+    next_try = Column(DateTime, index=True)
+
+
+class Cursor(Base):
+    __tablename__ = "cursors"
+
+    type = Column(String(16), primary_key=True)
+    ts = Column(DateTime)
+
+
+class SheetRow(Base):
+    __tablename__ = "sheet_rows"
+
+    id = Column(Integer, primary_key=True)
+    worksheet = Column(String(255))
+    row = Column(JSON)
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(128), unique=True)
+    chat_id = Column(Integer)
+    kind = Column(String(16))
+    payload = Column(JSON)
+    image = Column(LargeBinary)
+    attempts = Column(Integer, default=0)
+    next_try = Column(DateTime)
+
+
+def set_sqlite_pragma(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-16000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
 def init():
-    engine = create_engine(f"sqlite:///checkbox451_bot.db")
+    engine = create_engine(
+        "sqlite:///checkbox451_bot.db",
+        connect_args=dict(check_same_thread=False, cached_statements=256),
+        pool_size=4,
+    )
+    event.listen(engine, "connect", set_sqlite_pragma)
     Base.metadata.create_all(engine)
     return scoped_session(sessionmaker(bind=engine))
 
 
 Session = init()
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+
+async def run(func, *args, **kwargs):
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            Session.remove()
+
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
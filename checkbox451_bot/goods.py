@@ -1,21 +1,107 @@
+import asyncio
 from functools import lru_cache
 from logging import getLogger
+from math import isqrt
 
 from checkbox451_bot import checkbox_api
+from checkbox451_bot.config import Config
 
 log = getLogger(__name__)
 
+_catalogue = 0, {}
+_index = None, None
+
 
-@lru_cache(maxsize=1)
 def get_items():
+    return _catalogue[1]
+
+
+def get_catalogue():
+    return _catalogue
+
+
+class PriceIndex:
+    def __init__(self, items):
+        self.by_price = {good["price"]: good for good in items.values()}
+        self.prices = sorted(self.by_price, reverse=True)
+
+    def largest_divisor(self, price):
+        root = isqrt(price)
+        if len(self.prices) <= root:
+            for good_price in self.prices:
+                if good_price <= price and price % good_price == 0:
+                    return good_price
+            return None
+
+        for i in range(1, root + 1):
+            if price % i == 0 and price // i in self.by_price:
+                return price // i
+        for i in range(root, 0, -1):
+            if price % i == 0 and i in self.by_price:
+                return i
+
+    def match(self, price, *, rule="multiple"):
+        if price <= 0:
+            return None
+
+        if good := self.by_price.get(price):
+            return good, 1
+
+        if rule == "multiple":
+            if good_price := self.largest_divisor(price):
+                return self.by_price[good_price], price // good_price
+
+
+def price_index():
+    global _index
+
+    items = get_items()
+    if _index[0] is not items:
+        _index = items, PriceIndex(items)
+
+    return _index[1]
+
+
+@lru_cache(maxsize=1)
+def loaded():
+    return asyncio.Event()
+
+
+async def wait_loaded():
+    await loaded().wait()
+
+
+async def load_items():
+    global _catalogue
+
     items = {
         f"{good['name'].strip()} {good['price']/100:.2f} грн": {
             "code": good["code"],
             "name": good["name"],
             "price": good["price"],
         }
-        for good in checkbox_api.goods.goods()
+        for good in await checkbox_api.goods.goods()
     }
 
-    log.info(f"{items=}")
+    version, current = _catalogue
+    if items != current or not loaded().is_set():
+        _catalogue = version + 1, items
+        log.info("goods catalogue v%s: %s", version + 1, items)
+
+    loaded().set()
     return items
+
+
+async def refresher():
+    interval = Config().get("checkbox", "goods_refresh_interval", default=600)
+
+    while True:
+        try:
+            await load_items()
+        except Exception as e:
+            log.error("goods refresh failed: %r", e)
+            if not loaded().is_set():
+                await asyncio.sleep(min(interval, 60))
+                continue
+
+        await asyncio.sleep(interval)
@@ -1,22 +1,21 @@
 import asyncio
 import json
 from abc import ABC, abstractmethod
-from datetime import datetime
-from operator import itemgetter
+from datetime import date, datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
 from pathlib import Path
 from typing import Any, Dict, List
 
 from dateutil.parser import parse as datetime_parse
 from pydantic import BaseModel
-from sqlalchemy import update
+from sqlalchemy import func, update
+from sqlalchemy.orm.attributes import set_committed_value
 
-from checkbox451_bot import auth, checkbox_api, goods
-from checkbox451_bot.bot import Bot
+from checkbox451_bot import auth, checkbox_api, db, goods, outbox, receipts
 from checkbox451_bot.checkbox_api.helpers import aiohttp_session
 from checkbox451_bot.config import Config
-from checkbox451_bot.db import Session, Transaction
+from checkbox451_bot.db import Cursor, Session, Transaction
 from checkbox451_bot.gsheet import gsheet
-from checkbox451_bot.handlers import helpers
 
 
 class TransactionBase(BaseModel):
@@ -38,8 +37,17 @@ class TransactionBase(BaseModel):
     def __init__(self, **data):
         super().__init__(**data)
         self._orig = data
-        self._id = str(self._orig.get(self._id_key, ""))
-        self._type = type(self).__name__.removesuffix("Transaction").lower()
+        self._id = self.raw_id(self._orig)
+        self._type = self.type_name()
+
+    @classmethod
+    def raw_id(cls, data):
+        id_key = cls.__private_attributes__["_id_key"].get_default()
+        return str(data.get(id_key, ""))
+
+    @classmethod
+    def type_name(cls):
+        return cls.__name__.removesuffix("Transaction").lower()
 
     def __lt__(self, other: "TransactionBase"):
         return self.ts < other.ts
@@ -50,6 +58,11 @@ class TransactionBase(BaseModel):
     def check_income(self):
         return self.check_receipt()
 
+    def pending(self):
+        return (self.check_receipt() and not self.db.receipt) or (
+            self.check_income() and not self.db.income
+        )
+
     @property
     def orig(self):
         return self._orig
@@ -77,18 +90,81 @@ class TransactionBase(BaseModel):
         self._db = db
 
 
+def stage_options(stage):
+    defaults = {
+        "notify": dict(concurrency=4, batch_size=1),
+        "receipt": dict(concurrency=1, batch_size=50),
+        "income": dict(concurrency=2, batch_size=1),
+    }[stage]
+
+    return {
+        option: Config().get("transactions", stage, option, default=default)
+        for option, default in defaults.items()
+    }
+
+
+async def run_stage(items, handler, *, concurrency=1, batch_size=1):
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker():
+        while not queue.empty():
+            batch = [
+                queue.get_nowait()
+                for _ in range(min(batch_size, queue.qsize()))
+            ]
+            await handler(batch)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def goods_match():
+    return Config().get("transactions", "goods_match", default="multiple")
+
+
 class TransactionProcessorBase(ABC):
     transactions_file: Path
     transaction_cls: TransactionBase
+    window = timedelta(days=7)
+    overlap = timedelta(hours=1)
 
     def __init__(self, *, logger: Any, polling_interval=15):
         self.logger = logger
         self.polling_interval = polling_interval
 
     @abstractmethod
-    async def get_transactions(self) -> List[Dict[str, Any]]:
+    async def get_transactions(
+        self, start_time: datetime
+    ) -> List[Dict[str, Any]]:
         pass
 
+    def start_time(self, *, session: Session = None):
+        session = session or Session()
+        full_window = datetime.combine(date.today() - self.window, time.min)
+
+        cursor = session.get(Cursor, self.transaction_cls.type_name())
+        if cursor is None or cursor.ts - self.overlap < full_window:
+            return full_window
+
+        return cursor.ts - self.overlap
+
+    def update_cursor(self, transactions, *, session: Session = None):
+        session = session or Session()
+        type_name = self.transaction_cls.type_name()
+
+        if pending := [tr for tr in transactions if tr.pending()]:
+            ts = min(tr.ts for tr in pending)
+        elif not (
+            ts := session.query(func.max(Transaction.ts))
+            .filter(Transaction.type == type_name)
+            .scalar()
+        ):
+            return
+
+        session.merge(Cursor(type=type_name, ts=ts))
+        session.commit()
+
     @staticmethod
     async def store_transaction(transaction: TransactionBase):
         row = transaction.row()
@@ -97,11 +173,10 @@ class TransactionProcessorBase(ABC):
 
     @staticmethod
     async def bot_notify(transaction):
-        await helpers.broadcast(
-            None,
+        await outbox.enqueue(
             auth.SUPERVISOR,
-            Bot().send_message,
-            f"💸 Безготівкове зарахування: {transaction.sum} грн"
+            key=f"notify:{transaction.type}:{transaction.id}",
+            text=f"💸 Безготівкове зарахування: {transaction.sum} грн"
             + (
                 f"\n💁 Платник: {transaction.sender}"
                 if transaction.sender
@@ -110,24 +185,22 @@ class TransactionProcessorBase(ABC):
         )
 
     @staticmethod
-    def transaction_to_goods(transaction: TransactionBase):
+    def transaction_to_goods(
+        transaction: TransactionBase, *, match="multiple"
+    ):
         code = transaction.code
         name = transaction.name
-        price = float(transaction.sum) * 100
+        price = int(
+            (Decimal(transaction.sum) * 100).to_integral_value(ROUND_HALF_UP)
+        )
         quantity = 1000
 
-        goods_items = goods.get_items()
-        if goods_items:
-            for good in reversed(
-                sorted(goods_items.values(), key=itemgetter("price"))
-            ):
-                quotient, reminder = divmod(price, good_price := good["price"])
-                if reminder == 0:
-                    code = good["code"]
-                    name = good["name"]
-                    price = good_price
-                    quantity *= quotient
-                    break
+        if found := goods.price_index().match(price, rule=match):
+            good, multiplier = found
+            code = good["code"]
+            name = good["name"]
+            price = good["price"]
+            quantity *= multiplier
 
         return [
             {
@@ -141,17 +214,19 @@ class TransactionProcessorBase(ABC):
     @classmethod
     @aiohttp_session
     async def create_receipt(cls, transaction, *, session):
-        if goods_ := cls.transaction_to_goods(transaction):
+        if goods_ := cls.transaction_to_goods(
+            transaction, match=goods_match()
+        ):
             try:
-                receipt_id = await checkbox_api.receipt.sell(
-                    goods_, cashless=True, session=session
+                receipt_id = await receipts.sell(
+                    goods_,
+                    cashless=True,
+                    session=session,
+                    transaction=transaction,
                 )
             except Exception as e:
-                await helpers.broadcast(
-                    None,
-                    auth.SUPERVISOR,
-                    Bot().send_message,
-                    "Помилка створення чеку!",
+                await outbox.enqueue(
+                    auth.SUPERVISOR, text="Помилка створення чеку!"
                 )
                 raise e
         else:
@@ -170,24 +245,80 @@ class TransactionProcessorBase(ABC):
                 session=session,
             )
         except Exception:
-            await helpers.broadcast(
-                None,
+            await outbox.enqueue(
                 auth.SUPERVISOR,
-                Bot().send_message,
-                "Чек успішно створено",
+                key=f"receipt:{receipt_id}",
+                text="Чек успішно створено",
             )
             return
 
-        await helpers.broadcast(
-            None,
+        await outbox.enqueue(
+            auth.SUPERVISOR,
+            "receipt",
+            key=f"receipt:{receipt_id}",
+            image=receipt_image,
+            receipt_id=receipt_id,
+            url=receipt_url,
+            text=receipt_text,
+        )
+
+    @classmethod
+    @aiohttp_session
+    async def create_receipts(cls, transactions, *, session):
+        threshold = Config().get("checkbox", "batch", "threshold", default=5)
+        if len(transactions) < threshold:
+            results = []
+            for tr in transactions:
+                try:
+                    await cls.create_receipt(tr, session=session)
+                except Exception as err:
+                    results.append(err)
+                else:
+                    results.append(None)
+
+            return results
+
+        receipt_ids = await receipts.sell_batch(
+            [
+                cls.transaction_to_goods(tr, match=goods_match())
+                for tr in transactions
+            ],
+            cashless=True,
+            session=session,
+            transactions=transactions,
+            concurrency=Config().get(
+                "checkbox", "batch", "concurrency", default=4
+            ),
+        )
+        results = [
+            receipt_id if isinstance(receipt_id, Exception) else None
+            for receipt_id in receipt_ids
+        ]
+
+        created = [
+            (tr, receipt_id)
+            for tr, receipt_id in zip(transactions, receipt_ids)
+            if not isinstance(receipt_id, Exception)
+        ]
+        receipt_urls = await checkbox_api.receipt.wait_receipts_sign(
+            [receipt_id for _, receipt_id in created],
+            session=session,
+        )
+
+        total = sum(float(tr.sum) for tr, _ in created)
+        failed = len(transactions) - len(created)
+        unsigned = sum(isinstance(url, Exception) for url in receipt_urls)
+
+        await outbox.enqueue(
             auth.SUPERVISOR,
-            helpers.send_receipt,
-            receipt_id,
-            receipt_image,
-            receipt_url,
-            receipt_text,
+            text=f"🧾 Безготівкові чеки: {len(created)} з {len(transactions)}"
+            f"\n💸 Сума: {total:.2f} грн"
+            + (f"\n⚠️ Помилки створення: {failed}" if failed else "")
+            + (f"\n⏳ Не підписано: {unsigned}" if unsigned else ""),
         )
 
+        return results
+
     @staticmethod
     def get_or_create_db(tr, *, session: Session, **kwargs):
         if not (tr_db := session.query(Transaction).get((tr.type, tr.id))):
@@ -197,17 +328,60 @@ class TransactionProcessorBase(ABC):
         return tr_db
 
     @classmethod
-    def parse_transaction(cls, curr, *, session):
-        transactions = []
-        for tr in (cls.transaction_cls.parse_obj(c) for c in curr):
-            tr_db = cls.get_or_create_db(tr, session=session)
-            tr.set_db(tr_db)
-            transactions.append(tr)
+    def load_db(cls, ids, *, session, chunk_size=500):
+        ids = list(ids)
+        known = {}
+        for start in range(0, len(ids), chunk_size):
+            known.update(
+                (tr_db.id, tr_db)
+                for tr_db in session.query(Transaction).filter(
+                    Transaction.type == cls.transaction_cls.type_name(),
+                    Transaction.id.in_(ids[start:][:chunk_size]),
+                )
+            )
+
+        return known
+
+    @classmethod
+    def parse_transaction(cls, curr, *, session: Session = None):
+        session = session or Session()
+        raw = {cls.transaction_cls.raw_id(c): c for c in curr}
+        known = cls.load_db(raw, session=session)
+
+        transactions = [
+            cls.transaction_cls.parse_obj(c)
+            for tr_id, c in raw.items()
+            if not (
+                (tr_db := known.get(tr_id)) and tr_db.receipt and tr_db.income
+            )
+        ]
+
+        if missing := [
+            Transaction(
+                type=tr.type,
+                id=tr.id,
+                ts=tr.ts,
+                notify=False,
+                receipt=False,
+                income=False,
+            )
+            for tr in transactions
+            if tr.id not in known
+        ]:
+            session.add_all(missing)
+            session.commit()
+            known = cls.load_db(
+                (tr.id for tr in transactions), session=session
+            )
+
+        for tr in transactions:
+            tr.set_db(known[tr.id])
 
         return sorted(transactions)
 
     @staticmethod
-    def update_db(transaction, *, session, **kwargs):
+    def update_db(transaction, *, session: Session = None, **kwargs):
+        session = session or Session()
         session.execute(
             update(Transaction).where(
                 Transaction.type == transaction.type,
@@ -217,55 +391,77 @@ class TransactionProcessorBase(ABC):
         )
         session.commit()
 
+    @classmethod
+    async def mark(cls, transaction, **kwargs):
+        await db.run(cls.update_db, transaction, **kwargs)
+        for key, value in kwargs.items():
+            set_committed_value(transaction.db, key, value)
+
     async def process_transactions(self):
         try:
-            current = await self.get_transactions()
+            current = await self.get_transactions(
+                await db.run(self.start_time)
+            )
         except Exception as err:
             self.logger.exception(err)
             return []
 
-        with Session() as session:
-            if transactions := self.parse_transaction(
-                current, session=session
-            ):
-                for tr in transactions:
-                    log = tr.db.notify
-
-                    if tr.check_receipt() and not tr.db.receipt:
-                        if not tr.db.notify:
-                            self.logger.info(tr.orig)
-
-                            try:
-                                await self.bot_notify(tr)
-                            except Exception as err:
-                                self.logger.exception(err)
-                            else:
-                                self.update_db(
-                                    tr, notify=True, session=session
-                                )
-
-                        self.logger.info(tr.orig)
-
-                        try:
-                            await self.create_receipt(tr)
-                        except Exception as err:
-                            self.logger.exception(err)
-                        else:
-                            self.update_db(tr, receipt=True, session=session)
-
-                    if tr.check_income() and not tr.db.income:
-                        if log:
-                            self.logger.info(tr.orig)
-
-                        try:
-                            await self.store_transaction(tr)
-                        except Exception as err:
-                            self.logger.exception(err)
-                        else:
-                            self.update_db(tr, income=True, session=session)
-
-            else:
-                self.logger.debug("no new transactions")
+        if not (transactions := await db.run(self.parse_transaction, current)):
+            await db.run(self.update_cursor, transactions)
+            self.logger.debug("no new transactions")
+            return
+
+        pending = [
+            tr
+            for tr in transactions
+            if tr.check_receipt() and not tr.db.receipt
+        ]
+        incomes = [
+            tr for tr in transactions if tr.check_income() and not tr.db.income
+        ]
+
+        async def notify(batch):
+            for tr in batch:
+                if tr.db.notify:
+                    continue
+
+                self.logger.info(tr.orig)
+
+                try:
+                    await self.bot_notify(tr)
+                except Exception as err:
+                    self.logger.exception(err)
+                else:
+                    await self.mark(tr, notify=True)
+
+        async def fiscalize(batch):
+            for tr in batch:
+                self.logger.info(tr.orig)
+
+            for tr, err in zip(batch, await self.create_receipts(batch)):
+                if err:
+                    self.logger.exception(err)
+                else:
+                    await self.mark(tr, receipt=True)
+
+        async def store_income(batch):
+            for tr in batch:
+                self.logger.info(tr.orig)
+
+                try:
+                    await self.store_transaction(tr)
+                except Exception as err:
+                    self.logger.exception(err)
+                else:
+                    await self.mark(tr, income=True)
+
+        await asyncio.gather(
+            run_stage(pending, notify, **stage_options("notify")),
+            run_stage(pending, fiscalize, **stage_options("receipt")),
+            run_stage(incomes, store_income, **stage_options("income")),
+        )
+
+        await db.run(self.update_cursor, transactions)
 
     def pre_run_hook(self):
         if self.transactions_file.exists():
@@ -292,6 +488,8 @@ class TransactionProcessorBase(ABC):
         if not self.pre_run_hook():
             return
 
+        await goods.wait_loaded()
+
         shift_close_time = Config().get("checkbox", "shift_close_time")
 
         def shift_check():
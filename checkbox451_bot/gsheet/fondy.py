@@ -1,7 +1,7 @@
 import asyncio
 import hashlib
 import logging
-from datetime import date, datetime, time, timedelta
+from datetime import datetime
 from enum import Enum
 from pathlib import Path
 from typing import Any, Dict, List
@@ -13,9 +13,10 @@ from cachetools import TTLCache
 from dateutil.parser import parse as datetime_parse
 from pydantic import root_validator
 
-from checkbox451_bot import __product__
+from checkbox451_bot import __product__, goods, metrics, outbox
 from checkbox451_bot.bot import Bot
 from checkbox451_bot.config import Config
+from checkbox451_bot.gsheet import gsheet
 from checkbox451_bot.gsheet.common import (
     Logger,
     TransactionBase,
@@ -65,15 +66,14 @@ class FondyAPI:
 
         return response["token"]
 
-    async def report(self, merchant_id, *, client: RetryClient):
+    async def report(
+        self, merchant_id, start_time: datetime, *, client: RetryClient
+    ):
         url = "https://portal.fondy.eu/api/extend/company/report/"
 
         token = await self.token(client=client)
         headers = self._headers({"Authorization": f"Token {token}"})
 
-        start_date = date.today() - timedelta(days=7)
-        start_time = datetime.combine(start_date, time.min)
-
         result = []
 
         on_page = 500
@@ -111,9 +111,18 @@ class FondyAPI:
 
 
 class OrderStatus(str, Enum):
+    CREATED = "created"
+    PROCESSING = "processing"
     APPROVED = "approved"
+    DECLINED = "declined"
+    EXPIRED = "expired"
+    REVERSED = "reversed"
     _ = "(ignored)"
 
+    @property
+    def final(self):
+        return self not in (OrderStatus.CREATED, OrderStatus.PROCESSING)
+
     @classmethod
     def _missing_(cls, _):
         return cls._
@@ -154,6 +163,14 @@ class FondyTransaction(TransactionBase):
     def check_income(self):
         return self.settlement_status == SettlementStatus.COMPLETED
 
+    def pending(self):
+        if not self.order_status.final:
+            return True
+
+        return self.check_receipt() and not (
+            self.db.receipt and self.db.income
+        )
+
 
 class FondyTransactionProcessor(TransactionProcessorBase):
     transactions_file = Path("transactions-fondy.json")
@@ -187,15 +204,24 @@ class FondyTransactionProcessor(TransactionProcessorBase):
 
         return True
 
-    async def get_transactions(self) -> List[Dict[str, Any]]:
+    async def get_transactions(
+        self, start_time: datetime
+    ) -> List[Dict[str, Any]]:
         retry_options = ExponentialRetry(exceptions={ClientConnectorError})
-        async with ClientSession() as session:
+        async with ClientSession(
+            trace_configs=[metrics.trace_config("fondy")]
+        ) as session:
             retry_client = RetryClient(session, retry_options=retry_options)
-            return await self.api.report(self.merchant_id, client=retry_client)
+            return await self.api.report(
+                self.merchant_id, start_time, client=retry_client
+            )
 
 
 async def main():
     async with Bot().session_close():
+        asyncio.create_task(goods.refresher())
+        asyncio.create_task(gsheet.flush())
+        asyncio.create_task(outbox.sender())
         await FondyTransactionProcessor(logger=Logger).run()
 
 
@@ -1,13 +1,20 @@
+import asyncio
 from functools import lru_cache
 from logging import getLogger
+from typing import Dict
 
 import gspread_asyncio
 from google.oauth2.service_account import Credentials
 
+from checkbox451_bot import db, metrics
 from checkbox451_bot.config import Config
 
 log = getLogger(__name__)
 
+_worksheets: Dict[str, gspread_asyncio.AsyncioGspreadWorksheet] = {}
+_flush_timers: Dict[str, asyncio.Task] = {}
+_flush_failures: Dict[str, int] = {}
+
 
 def get_creds():
     service_account_file = Config().get("google", "application_credentials")
@@ -20,11 +27,58 @@ def get_creds():
     return scoped
 
 
+async def worksheet(worksheet_title):
+    if (wks := _worksheets.get(worksheet_title)) is None:
+        with metrics.track("sheets", "open_worksheet"):
+            client = await manager().authorize()
+            spreadsheet = await client.open_by_key(
+                Config().get("google", "spreadsheet_key")
+            )
+            wks = await spreadsheet.worksheet(worksheet_title)
+        _worksheets[worksheet_title] = wks
+
+    return wks
+
+
+def store_row(row, worksheet_title):
+    session = db.Session()
+    session.add(db.SheetRow(worksheet=worksheet_title, row=list(row)))
+    session.commit()
+
+    return (
+        session.query(db.SheetRow)
+        .filter(db.SheetRow.worksheet == worksheet_title)
+        .count()
+    )
+
+
+def pending_rows(worksheet_title=None):
+    session = db.Session()
+
+    query = session.query(db.SheetRow).order_by(db.SheetRow.id)
+    if worksheet_title:
+        query = query.filter(db.SheetRow.worksheet == worksheet_title)
+
+    rows: Dict[str, list] = {}
+    for sheet_row in query:
+        rows.setdefault(sheet_row.worksheet, []).append(
+            (sheet_row.id, sheet_row.row)
+        )
+
+    return rows
+
+
+def delete_rows(row_ids):
+    session = db.Session()
+    session.query(db.SheetRow).filter(db.SheetRow.id.in_(row_ids)).delete()
+    session.commit()
+
+
 async def append_row(row, worksheet_title):
     if not manager():
         return
 
-    if not (spreadsheet_key := Config().get("google", "spreadsheet_key")):
+    if not Config().get("google", "spreadsheet_key"):
         log.warning("missing spreadsheet key; ignoring...")
         return
 
@@ -32,11 +86,71 @@ async def append_row(row, worksheet_title):
         log.warning("missing worksheet title; ignoring...")
         return
 
-    client = await manager().authorize()
-    spreadsheet = await client.open_by_key(spreadsheet_key)
-    wks = await spreadsheet.worksheet(worksheet_title)
+    pending = await db.run(store_row, row, worksheet_title)
+    if pending >= Config().get("google", "flush", "size", default=50):
+        await flush(worksheet_title)
+    else:
+        flush_later(
+            worksheet_title,
+            Config().get("google", "flush", "interval", default=10),
+        )
+
+
+def flush_later(worksheet_title, delay):
+    if worksheet_title not in _flush_timers:
+        _flush_timers[worksheet_title] = asyncio.create_task(
+            delayed_flush(worksheet_title, delay)
+        )
+
+
+async def delayed_flush(worksheet_title, delay):
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        _flush_timers.pop(worksheet_title, None)
+
+    await flush(worksheet_title)
+
+
+def retry_delay(failures):
+    interval = Config().get("google", "flush", "interval", default=10)
+    max_delay = Config().get("google", "flush", "max_delay", default=300)
+    return min(interval * 2**failures, max_delay)
+
+
+@lru_cache(maxsize=1)
+def flush_lock():
+    return asyncio.Lock()
+
+
+async def flush(worksheet_title=None):
+    if not manager():
+        return
+
+    async with flush_lock():
+        rows = await db.run(pending_rows, worksheet_title)
+
+        for title, sheet_rows in rows.items():
+            try:
+                wks = await worksheet(title)
+                with metrics.track("sheets", "append_rows"):
+                    await wks.append_rows(
+                        [row for _, row in sheet_rows],
+                        value_input_option="USER_ENTERED",
+                    )
+            except Exception:
+                log.exception("flush failed: %s", title)
+                _worksheets.pop(title, None)
+                failures = _flush_failures[title] = (
+                    _flush_failures.get(title, 0) + 1
+                )
+                flush_later(title, retry_delay(failures))
+                continue
+
+            _flush_failures.pop(title, None)
+            await db.run(delete_rows, [row_id for row_id, _ in sheet_rows])
 
-    await wks.append_row(row, value_input_option="USER_ENTERED")
+            log.info("flushed %s rows: %s", len(sheet_rows), title)
 
 
 @lru_cache(maxsize=1)
@@ -1,7 +1,7 @@
 import asyncio
 import logging
 import re
-from datetime import date, timedelta
+from datetime import datetime
 from enum import Enum
 from functools import lru_cache
 from pathlib import Path
@@ -11,9 +11,10 @@ from aiohttp import ClientSession
 from dateutil.parser import parse as datetime_parse
 from pydantic import root_validator
 
-from checkbox451_bot import __product__
+from checkbox451_bot import __product__, goods, metrics, outbox
 from checkbox451_bot.bot import Bot
 from checkbox451_bot.config import Config
+from checkbox451_bot.gsheet import gsheet
 from checkbox451_bot.gsheet.common import (
     Logger,
     TransactionBase,
@@ -111,14 +112,17 @@ class Privat24TransactionProcessor(TransactionProcessorBase):
 
         return True
 
-    async def get_transactions(self) -> List[Dict[str, Any]]:
+    async def get_transactions(
+        self, start_time: datetime
+    ) -> List[Dict[str, Any]]:
         transactions = []
 
         exist_next_page = True
         next_page_id = ""
-        start_date = date.today() - timedelta(days=7)
-        while exist_next_page:
-            async with ClientSession() as session:
+        async with ClientSession(
+            trace_configs=[metrics.trace_config("privat24")]
+        ) as session:
+            while exist_next_page:
                 async with session.get(
                     URL,
                     headers={
@@ -128,23 +132,26 @@ class Privat24TransactionProcessor(TransactionProcessorBase):
                         "Content-Type": "application/json; charset=utf8",
                     },
                     params={
-                        "startDate": start_date.strftime("%d-%m-%Y"),
+                        "startDate": start_time.strftime("%d-%m-%Y"),
                         "followId": next_page_id,
                     },
                 ) as response:
                     response.raise_for_status()
                     result = await response.json()
 
-            transactions += result["transactions"]
+                transactions += result["transactions"]
 
-            if exist_next_page := result["exist_next_page"]:
-                next_page_id = result["next_page_id"]
+                if exist_next_page := result["exist_next_page"]:
+                    next_page_id = result["next_page_id"]
 
         return transactions
 
 
 async def main():
     async with Bot().session_close():
+        asyncio.create_task(goods.refresher())
+        asyncio.create_task(gsheet.flush())
+        asyncio.create_task(outbox.sender())
         await Privat24TransactionProcessor(logger=Logger).run()
 
 
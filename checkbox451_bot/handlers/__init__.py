@@ -1,17 +1,103 @@
-from aiogram import Dispatcher
+import asyncio
+from logging import getLogger
+from urllib.parse import urlparse
+
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.utils import executor
+from aiohttp import web
 
+from checkbox451_bot import metrics
 from checkbox451_bot.bot import Bot
+from checkbox451_bot.checkbox_api.helpers import close_client_session
+from checkbox451_bot.config import Config
 from checkbox451_bot.handlers import admin, auth, cashier, helpers
+from checkbox451_bot.handlers.scheduler import Dispatcher
 
+log = getLogger(__name__)
 
-def start_polling():
-    dispatcher = Dispatcher(Bot())
+
+def init_dispatcher():
+    dispatcher = Dispatcher(
+        Bot(),
+        concurrency=Config().get("telegram_bot", "concurrency", default=16),
+        max_pending=Config().get("telegram_bot", "max_pending"),
+    )
     dispatcher.middleware.setup(LoggingMiddleware())
+    metrics.register(
+        metrics.Gauges("dispatcher", "Update scheduler", dispatcher.metrics)
+    )
 
     admin.init(dispatcher)
     auth.init(dispatcher)
     cashier.init(dispatcher)
 
-    executor.start_polling(dispatcher, skip_updates=True)
+    return dispatcher
+
+
+async def on_shutdown(_):
+    await close_client_session()
+
+
+def start_polling():
+    executor.start_polling(
+        init_dispatcher(),
+        skip_updates=True,
+        on_shutdown=on_shutdown,
+    )
+
+
+def secret_middleware(secret):
+    @web.middleware
+    async def middleware(request, handler):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+        if token != secret:
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+
+    return middleware
+
+
+def start_webhook():
+    url = Config().get("telegram_bot", "webhook", "url", required=True)
+    secret = Config().get("telegram_bot", "webhook", "secret")
+    max_connections = Config().get(
+        "telegram_bot", "webhook", "max_connections", default=40
+    )
+
+    async def on_startup(dispatcher):
+        await dispatcher.bot.set_webhook(
+            url,
+            max_connections=max_connections,
+            drop_pending_updates=False,
+            secret_token=secret,
+        )
+        log.info(f"{url=} {max_connections=}")
+
+    loop = asyncio.get_event_loop()
+
+    web_app = None
+    if secret:
+        web_app = web.Application(middlewares=[secret_middleware(secret)])
+
+    executor.set_webhook(
+        init_dispatcher(),
+        urlparse(url).path or "/",
+        loop=loop,
+        skip_updates=False,
+        on_startup=on_startup,
+        on_shutdown=on_shutdown,
+        web_app=web_app,
+    ).run_app(
+        host=Config().get(
+            "telegram_bot", "webhook", "host", default="127.0.0.1"
+        ),
+        port=Config().get("telegram_bot", "webhook", "port", default=8080),
+        loop=loop,
+    )
+
+
+def start():
+    if Config().get("telegram_bot", "webhook", "url"):
+        start_webhook()
+    else:
+        start_polling()
@@ -13,9 +13,10 @@ def init(dispatcher):
     @auth.require(auth.ADMIN)
     @helpers.error_handler
     async def users(message: Message):
-        session = db.Session()
-        users_repr = [str(u) for u in session.query(db.User)]
-        text = "\n".join(users_repr)
+        def users_repr():
+            return [str(u) for u in db.Session().query(db.User)]
+
+        text = "\n".join(await db.run(users_repr))
         await message.answer(text)
 
     @dispatcher.message_handler(commands=["sign"])
@@ -55,6 +56,7 @@ def init(dispatcher):
         if user := session.query(db.User).get(user_id):
             session.delete(user)
             session.commit()
+            auth.RoleIndex().invalidate()
             await message.answer(f"deleted: {user_id}")
             await Bot().send_message(
                 user.user_id,
@@ -2,7 +2,7 @@ from logging import getLogger
 
 from aiogram.types import CallbackQuery, Message
 
-from checkbox451_bot import auth, pos
+from checkbox451_bot import auth, pos, receipts, tracing
 from checkbox451_bot.bot import Bot
 from checkbox451_bot.checkbox_api import receipt, shift
 from checkbox451_bot.checkbox_api.helpers import aiohttp_session
@@ -25,15 +25,26 @@ def init(dispatcher):
     @dispatcher.message_handler(regexp=helpers.goods_pattern)
     @auth.require(auth.CASHIER)
     @helpers.error_handler
+    @tracing.traced("cashier.sell")
     @aiohttp_session
     async def sell(message: Message, *, session):
         await Bot().send_chat_action(message.chat.id, "upload_document")
 
-        if (goods := helpers.text_to_goods(message.text)) is None:
-            log.error("parse error: %s", message.text)
-            raise ValueError("Не вдалося розібрати повідомлення")
-
-        receipt_id = await receipt.sell(goods, session=session)
+        goods = helpers.text_to_goods(message.text)
+        tracing.annotate(chat_id=message.chat.id, goods=len(goods))
+        try:
+            receipt_id = await receipts.sell(
+                goods,
+                session=session,
+                chat_id=message.chat.id,
+            )
+        except receipts.ReceiptQueued:
+            await message.answer(
+                "📥 Checkbox недоступний: продаж збережено, чек буде "
+                "створено автоматично після відновлення зв'язку"
+            )
+            await start(message)
+            return
 
         try:
             receipt_url = await receipt.wait_receipt_sign(
@@ -1,9 +1,10 @@
 import asyncio
 import functools
 import re
+from decimal import Decimal
 from io import BytesIO
 from logging import getLogger
-from typing import Union
+from typing import Dict, Union
 
 from aiogram.types import (
     CallbackQuery,
@@ -12,10 +13,12 @@ from aiogram.types import (
     Message,
 )
 from aiogram.utils.exceptions import RetryAfter
+from cachetools import TTLCache
 
-from checkbox451_bot import auth, db
+from checkbox451_bot import auth
 from checkbox451_bot.bot import Bot
 from checkbox451_bot.kbd import kbd
+from checkbox451_bot.tracing import traced
 
 log = getLogger(__name__)
 
@@ -25,24 +28,51 @@ async def start(user_id):
 
 
 async def broadcast(user_id, role_name, send_message, *args, **kwargs):
-    session = db.Session()
-    if not (role := session.query(db.Role).get(role_name)):
-        return
-
-    async def send(user):
-        if user.user_id != user_id:
+    async def send(recipient):
+        if recipient != user_id:
             for _ in range(10):
                 try:
-                    await send_message(user.user_id, *args, **kwargs)
+                    await send_message(recipient, *args, **kwargs)
                 except RetryAfter as err:
                     log.exception(err)
                     await asyncio.sleep(err.timeout)
                 else:
                     break
 
-    await asyncio.gather(*[send(user) for user in role.users])
+    recipients = auth.role_users(role_name)
+    await asyncio.gather(*[send(recipient) for recipient in recipients])
+
+
+receipt_photos = TTLCache(maxsize=256, ttl=3600)
+receipt_uploads: Dict[str, asyncio.Lock] = {}
+receipt_upload_waiters: Dict[str, int] = {}
 
 
+@traced()
+async def send_receipt_photo(user_id, receipt_id, receipt_image):
+    if file_id := receipt_photos.get(receipt_id):
+        return await Bot().send_photo(user_id, file_id)
+
+    lock = receipt_uploads.setdefault(receipt_id, asyncio.Lock())
+    receipt_upload_waiters[receipt_id] = (
+        receipt_upload_waiters.get(receipt_id, 0) + 1
+    )
+    try:
+        async with lock:
+            if file_id := receipt_photos.get(receipt_id):
+                return await Bot().send_photo(user_id, file_id)
+
+            message = await Bot().send_photo(user_id, BytesIO(receipt_image))
+            receipt_photos[receipt_id] = message.photo[-1].file_id
+            return message
+    finally:
+        if not (waiters := receipt_upload_waiters[receipt_id] - 1):
+            del receipt_uploads[receipt_id], receipt_upload_waiters[receipt_id]
+        else:
+            receipt_upload_waiters[receipt_id] = waiters
+
+
+@traced()
 async def send_receipt(
     user_id,
     receipt_id,
@@ -50,7 +80,7 @@ async def send_receipt(
     receipt_url,
     receipt_text,
 ):
-    await Bot().send_photo(user_id, BytesIO(receipt_image))
+    await send_receipt_photo(user_id, receipt_id, receipt_image)
 
     if receipt_url:
         await Bot().send_message(user_id, receipt_url)
@@ -101,19 +131,36 @@ goods_pattern = re.compile(
 )
 
 
+line_pattern = re.compile(goods_pattern.pattern)
+
+
+class GoodsParseError(ValueError):
+    def __init__(self, lineno, line):
+        super().__init__(f"Не вдалося розібрати рядок {lineno}: {line}")
+        self.lineno = lineno
+        self.line = line
+
+
+def to_int(number, scale):
+    return int(Decimal(number.replace(",", ".")) * scale)
+
+
 def text_to_goods(text):
-    if len(text.splitlines()) != len(items := goods_pattern.findall(text)):
-        return
-
-    goods = [
-        {
-            "name": (name := item[0]),
-            "price": (price := int(float(item[1].replace(",", ".")) * 100)),
-            "quantity": int(float(item[2].replace(",", ".") or 1) * 1000),
-            "code": f"{name} {price / 100:.02f}",
-        }
-        for item in items
-    ]
+    goods = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if not (match := line_pattern.match(line)):
+            raise GoodsParseError(lineno, line)
+
+        name, price, quantity = match.groups()
+        price = to_int(price, 100)
+        goods.append(
+            {
+                "name": name,
+                "price": price,
+                "quantity": to_int(quantity or "1", 1000),
+                "code": f"{name} {price / 100:.02f}",
+            }
+        )
 
     return goods
 
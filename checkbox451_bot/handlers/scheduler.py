@@ -0,0 +1,100 @@
+import asyncio
+from logging import getLogger
+from typing import Dict, Set
+
+from aiogram import Dispatcher as BaseDispatcher
+from aiogram import types
+
+log = getLogger(__name__)
+
+
+def update_chat_id(update: types.Update):
+    if message := update.message or update.edited_message:
+        return message.chat.id
+
+    if update.callback_query:
+        return update.callback_query.from_user.id
+
+
+class Dispatcher(BaseDispatcher):
+    def __init__(self, *args, concurrency=16, max_pending=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency
+        self.max_pending = max_pending or concurrency * 4
+        self.pending = 0
+        self.throttled = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+        self._admitted: Set[int] = set()
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_pending: Dict[int, int] = {}
+
+    def _acquire(self):
+        self.pending += 1
+        if self.pending >= self.max_pending:
+            self._capacity.clear()
+
+    def _release(self):
+        self.pending -= 1
+        if self.pending < self.max_pending:
+            self._capacity.set()
+
+    async def wait_capacity(self):
+        if not self._capacity.is_set():
+            log.warning("pending updates: %s, pausing intake", self.pending)
+            self.throttled += 1
+            await self._capacity.wait()
+
+    async def start_polling(self, *args, **kwargs):
+        get_updates = self.bot.get_updates
+
+        async def throttled_get_updates(*a, **kw):
+            await self.wait_capacity()
+            updates = await get_updates(*a, **kw)
+            for update in updates:
+                self._admitted.add(update.update_id)
+                self._acquire()
+            return updates
+
+        self.bot.get_updates = throttled_get_updates
+        try:
+            return await super().start_polling(*args, **kwargs)
+        finally:
+            self.bot.get_updates = get_updates
+
+    async def process_update(self, update: types.Update):
+        if update.update_id in self._admitted:
+            self._admitted.discard(update.update_id)
+        else:
+            self._acquire()
+
+        try:
+            if (chat_id := update_chat_id(update)) is None:
+                async with self._semaphore:
+                    return await super().process_update(update)
+
+            return await self._process_chat_update(chat_id, update)
+        finally:
+            self._release()
+
+    async def _process_chat_update(self, chat_id, update: types.Update):
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_pending[chat_id] = self._chat_pending.get(chat_id, 0) + 1
+
+        try:
+            async with lock:
+                async with self._semaphore:
+                    return await super().process_update(update)
+        finally:
+            if not (pending := self._chat_pending[chat_id] - 1):
+                del self._chat_locks[chat_id], self._chat_pending[chat_id]
+            else:
+                self._chat_pending[chat_id] = pending
+
+    def metrics(self):
+        return {
+            "pending": self.pending,
+            "chats": len(self._chat_locks),
+            "throttled": self.throttled,
+        }
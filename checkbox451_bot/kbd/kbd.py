@@ -6,7 +6,7 @@ from aiogram.types import (
     ReplyKeyboardRemove,
 )
 
-from checkbox451_bot.goods import get_items
+from checkbox451_bot.goods import get_catalogue
 from checkbox451_bot.kbd.buttons import btn_auth, btn_cancel, btn_receipt
 
 remove = ReplyKeyboardRemove()
@@ -18,7 +18,12 @@ start = ReplyKeyboardMarkup(resize_keyboard=True, row_width=1).add(btn_receipt)
 
 
 @lru_cache(maxsize=1)
-def goods():
+def _goods(version, items):
     return ReplyKeyboardMarkup(
         resize_keyboard=True, one_time_keyboard=True, row_width=1
-    ).add(*get_items(), btn_cancel)
+    ).add(*items, btn_cancel)
+
+
+def goods():
+    version, items = get_catalogue()
+    return _goods(version, tuple(items))
@@ -0,0 +1,217 @@
+import asyncio
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Callable, Dict, List, Tuple
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+from checkbox451_bot.config import Config
+
+log = getLogger(__name__)
+
+PREFIX = "checkbox451"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_id_pattern = re.compile(
+    r"/(?:\d+|[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12})(?=/|$)"
+)
+_token_pattern = re.compile(r"/bot\d+:[^/]+")
+
+
+def labels_repr(labels: Tuple[Tuple[str, str], ...]):
+    if not labels:
+        return ""
+
+    pairs = ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for key, value in labels
+    )
+    return f"{{{pairs}}}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = f"{PREFIX}_{name}"
+        self.help_text = help_text
+        self.values: Dict[tuple, float] = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        self.values[tuple(sorted(labels.items()))] += amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = f"{PREFIX}_{name}"
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        if (counts := self.values.get(key)) is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 2)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for labels, counts in self.values.items():
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                le = labels + (("le", bound),)
+                yield f"{self.name}_bucket", le, total
+            yield f"{self.name}_count", labels, total
+            yield f"{self.name}_sum", labels, counts[-1]
+
+
+class Gauges:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, collect: Callable[[], dict]):
+        self.name = f"{PREFIX}_{name}"
+        self.help_text = help_text
+        self.collect = collect
+
+    def samples(self):
+        for key, value in self.collect().items():
+            yield self.name, (("name", key),), value
+
+
+_registry: List = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+requests = register(
+    Counter("upstream_requests_total", "Upstream requests by status")
+)
+latency = register(
+    Histogram(
+        "upstream_request_duration_seconds",
+        "Upstream request latency until response headers",
+    )
+)
+retries = register(Counter("upstream_retries_total", "Upstream retries"))
+timeouts = register(Counter("upstream_timeouts_total", "Upstream timeouts"))
+
+
+def endpoint_name(path):
+    return _id_pattern.sub("/{id}", _token_pattern.sub("/bot{token}", path))
+
+
+def record(upstream, method, endpoint, status, duration):
+    labels = dict(upstream=upstream, method=method, endpoint=endpoint)
+    requests.inc(status=str(status), **labels)
+    latency.observe(duration, **labels)
+    if status == "timeout":
+        timeouts.inc(**labels)
+
+
+def retry(upstream, url):
+    retries.inc(upstream=upstream, endpoint=endpoint_name(URL(url).path))
+
+
+def exception_status(exception):
+    if isinstance(exception, asyncio.TimeoutError):
+        return "timeout"
+    return type(exception).__name__
+
+
+def trace_config(upstream):
+    async def on_request_start(_, ctx, __):
+        ctx.start = time.perf_counter()
+
+    async def on_request_end(_, ctx, params):
+        record(
+            upstream,
+            params.method,
+            endpoint_name(params.url.path),
+            params.response.status,
+            time.perf_counter() - ctx.start,
+        )
+
+    async def on_request_exception(_, ctx, params):
+        record(
+            upstream,
+            params.method,
+            endpoint_name(params.url.path),
+            exception_status(params.exception),
+            time.perf_counter() - ctx.start,
+        )
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    config.on_request_exception.append(on_request_exception)
+    return config
+
+
+@contextmanager
+def track(upstream, endpoint, method="CALL"):
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = exception_status(e)
+        raise
+    finally:
+        record(upstream, method, endpoint, status, time.perf_counter() - start)
+
+
+def expose():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(
+            f"{name}{labels_repr(labels)} {value}"
+            for name, labels, value in metric.samples()
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(_):
+    return web.Response(text=expose(), content_type="text/plain")
+
+
+async def serve():
+    if not (port := Config().get("metrics", "port")):
+        return
+
+    host = Config().get("metrics", "host", default="127.0.0.1")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info(f"{host=} {port=}")
+
+    return runner
@@ -0,0 +1,187 @@
+import asyncio
+from datetime import datetime, timedelta
+from functools import lru_cache
+from logging import getLogger
+
+from aiogram.utils.exceptions import RetryAfter
+from sqlalchemy.dialects.sqlite import insert
+
+from checkbox451_bot import auth, db
+from checkbox451_bot.bot import Bot
+from checkbox451_bot.handlers import helpers
+
+log = getLogger(__name__)
+
+MAX_ATTEMPTS = 10
+
+
+async def send_message(chat_id, payload, _):
+    await Bot().send_message(chat_id, payload["text"])
+
+
+async def send_error(chat_id, payload, _):
+    await helpers.error(chat_id, payload["text"])
+
+
+async def send_receipt(chat_id, payload, image):
+    await helpers.send_receipt(
+        chat_id,
+        payload["receipt_id"],
+        image,
+        payload["url"],
+        payload["text"],
+    )
+
+
+senders = {
+    "message": send_message,
+    "error": send_error,
+    "receipt": send_receipt,
+}
+
+
+@lru_cache(maxsize=1)
+def wakeup():
+    return asyncio.Event()
+
+
+def store(rows):
+    session = db.Session()
+    session.execute(
+        insert(db.OutboxMessage).on_conflict_do_nothing(
+            index_elements=["key"]
+        ),
+        rows,
+    )
+    session.commit()
+
+
+async def push(chat_ids, kind="message", *, key=None, image=None, **payload):
+    if kind not in senders:
+        raise ValueError(f"invalid kind: {kind}")
+
+    now = datetime.now()
+    rows = [
+        dict(
+            key=f"{key}:{chat_id}" if key else None,
+            chat_id=chat_id,
+            kind=kind,
+            payload=payload,
+            image=image,
+            attempts=0,
+            next_try=now,
+        )
+        for chat_id in chat_ids
+    ]
+
+    if rows:
+        await db.run(store, rows)
+        wakeup().set()
+
+
+async def enqueue(
+    role_name,
+    kind="message",
+    *,
+    key=None,
+    exclude=None,
+    image=None,
+    **payload,
+):
+    await push(
+        [
+            chat_id
+            for chat_id in auth.role_users(role_name)
+            if chat_id != exclude
+        ],
+        kind,
+        key=key,
+        image=image,
+        **payload,
+    )
+
+
+def due_messages(limit):
+    session = db.Session()
+    return [
+        (message.id, message.chat_id, message.kind, message.payload)
+        for message in session.query(db.OutboxMessage)
+        .filter(db.OutboxMessage.next_try <= datetime.now())
+        .order_by(db.OutboxMessage.id)
+        .limit(limit)
+    ]
+
+
+def message_image(message_id):
+    return db.Session().get(db.OutboxMessage, message_id).image
+
+
+def finish(sent, failed):
+    session = db.Session()
+
+    if sent:
+        session.query(db.OutboxMessage).filter(
+            db.OutboxMessage.id.in_(sent)
+        ).delete()
+
+    for message_id, delay in failed.items():
+        message = session.get(db.OutboxMessage, message_id)
+        message.attempts += 1
+        if message.attempts >= MAX_ATTEMPTS:
+            log.error("dropping message: %s", message.payload)
+            session.delete(message)
+        else:
+            message.next_try = datetime.now() + timedelta(
+                seconds=delay or min(2**message.attempts, 300)
+            )
+
+    session.commit()
+
+
+async def deliver(message_id, chat_id, kind, payload):
+    image = (
+        await db.run(message_image, message_id) if kind == "receipt" else None
+    )
+
+    await senders[kind](chat_id, payload, image)
+
+
+async def deliver_due(batch_size=20):
+    if not (messages := await db.run(due_messages, batch_size)):
+        return 0
+
+    results = await asyncio.gather(
+        *(deliver(*message) for message in messages),
+        return_exceptions=True,
+    )
+
+    sent = []
+    failed = {}
+    for (message_id, *_), result in zip(messages, results):
+        if isinstance(result, RetryAfter):
+            failed[message_id] = result.timeout
+        elif isinstance(result, Exception):
+            log.error("delivery failed: %r", result)
+            failed[message_id] = None
+        else:
+            sent.append(message_id)
+
+    await db.run(finish, sent, failed)
+
+    return len(sent)
+
+
+async def sender(interval=5):
+    while True:
+        wakeup().clear()
+
+        try:
+            if await deliver_due():
+                continue
+        except Exception:
+            log.exception("outbox error")
+
+        try:
+            await asyncio.wait_for(wakeup().wait(), interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from functools import lru_cache
+from typing import Dict
+
+from checkbox451_bot import metrics
+from checkbox451_bot.config import Config
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        self._tokens -= 1
+
+        return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self):
+        if delay := self.reserve():
+            await asyncio.sleep(delay)
+
+
+class Limiter:
+    def __init__(self, rate, chat_rate, chat_burst):
+        self._global = TokenBucket(rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: Dict[int, TokenBucket] = {}
+        self.waiting = 0
+        self.sent = 0
+
+    async def acquire(self, chat_id):
+        if (bucket := self._chats.get(chat_id)) is None:
+            bucket = self._chats[chat_id] = TokenBucket(
+                self._chat_rate, self._chat_burst
+            )
+
+        self.waiting += 1
+        try:
+            await bucket.acquire()
+            await self._global.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.sent += 1
+
+    def metrics(self):
+        return {"waiting": self.waiting, "sent": self.sent}
+
+
+@lru_cache(maxsize=1)
+def limiter():
+    return Limiter(
+        rate=Config().get("telegram_bot", "rate_limit", "rate", default=25),
+        chat_rate=Config().get(
+            "telegram_bot", "rate_limit", "chat_rate", default=1
+        ),
+        chat_burst=Config().get(
+            "telegram_bot", "rate_limit", "chat_burst", default=3
+        ),
+    )
+
+
+metrics.register(
+    metrics.Gauges(
+        "telegram_limiter",
+        "Telegram rate limiter",
+        lambda: limiter().metrics(),
+    )
+)
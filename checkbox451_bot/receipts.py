@@ -0,0 +1,333 @@
+import asyncio
+from datetime import datetime, timedelta
+from logging import getLogger
+from uuid import uuid4
+
+import aiohttp
+
+from checkbox451_bot import auth, checkbox_api, db, metrics, outbox
+from checkbox451_bot.checkbox_api.exceptions import CheckboxUnavailableError
+from checkbox451_bot.checkbox_api.helpers import aiohttp_session
+from checkbox451_bot.config import Config
+from checkbox451_bot.ratelimit import TokenBucket
+
+log = getLogger(__name__)
+
+PENDING = "PENDING"
+QUEUED = "QUEUED"
+DONE = "DONE"
+FAILED = "FAILED"
+
+UNKNOWN_OUTCOME = (asyncio.TimeoutError, aiohttp.ClientConnectionError)
+OFFLINE = (CheckboxUnavailableError, *UNKNOWN_OUTCOME)
+
+drained = metrics.register(
+    metrics.Counter("offline_receipts_total", "Queued receipts by outcome")
+)
+
+
+class ReceiptQueued(Exception):
+    def __init__(self, receipt_id):
+        super().__init__(receipt_id)
+        self.receipt_id = receipt_id
+
+
+def offline(option, default=None):
+    return Config().get("checkbox", "offline", option, default=default)
+
+
+def prepare(goods_list, cashless, transactions, chat_id=None):
+    session = db.Session()
+
+    prepared = []
+    for goods, transaction in zip(goods_list, transactions):
+        if transaction is not None and (
+            receipt := session.query(db.Receipt)
+            .filter(
+                db.Receipt.transaction_type == transaction.type,
+                db.Receipt.transaction_id == transaction.id,
+            )
+            .order_by(db.Receipt.status != DONE, db.Receipt.created.desc())
+            .first()
+        ):
+            prepared.append((receipt.id, receipt.goods, receipt.status))
+            continue
+
+        receipt_id = str(uuid4())
+        session.add(
+            db.Receipt(
+                id=receipt_id,
+                status=PENDING,
+                goods=goods,
+                cashless=cashless,
+                created=datetime.now(),
+                transaction_type=transaction and transaction.type,
+                transaction_id=transaction and transaction.id,
+                chat_id=chat_id,
+                attempts=0,
+                next_try=datetime.now(),
+            )
+        )
+        prepared.append((receipt_id, goods, None))
+
+    session.commit()
+    return prepared
+
+
+def set_status(statuses):
+    session = db.Session()
+    for receipt_id, status in statuses.items():
+        receipt = session.get(db.Receipt, receipt_id)
+        receipt.status = status
+        if status == DONE and receipt.transaction_id is not None:
+            session.query(db.Transaction).filter(
+                db.Transaction.type == receipt.transaction_type,
+                db.Transaction.id == receipt.transaction_id,
+            ).update({db.Transaction.receipt: True})
+    session.commit()
+
+
+def result_status(result, queue=False):
+    if not isinstance(result, Exception):
+        return DONE
+    if queue and isinstance(result, OFFLINE):
+        return QUEUED
+    if isinstance(result, UNKNOWN_OUTCOME):
+        return PENDING
+    return FAILED
+
+
+async def sell_batch(
+    goods_list,
+    cashless=False,
+    *,
+    session=None,
+    transactions=None,
+    concurrency=4,
+    chat_id=None,
+):
+    transactions = transactions or [None] * len(goods_list)
+    prepared = await db.run(
+        prepare, goods_list, cashless, transactions, chat_id
+    )
+
+    done = [receipt_id for receipt_id, _, status in prepared if status == DONE]
+    for receipt_id in done:
+        log.info("receipt already fiscalized: %s", receipt_id)
+
+    reused = [
+        receipt_id
+        for receipt_id, _, status in prepared
+        if status not in (None, DONE)
+    ]
+    exists = await asyncio.gather(
+        *(
+            checkbox_api.receipt.receipt_exists(receipt_id, session=session)
+            for receipt_id in reused
+        )
+    )
+    results = {receipt_id: receipt_id for receipt_id in done}
+    for receipt_id, found in zip(reused, exists):
+        if found:
+            log.info("receipt reconciled: %s", receipt_id)
+            results[receipt_id] = receipt_id
+
+    todo = [
+        (receipt_id, goods)
+        for receipt_id, goods, _ in prepared
+        if receipt_id not in results
+    ]
+    if todo:
+        sold = await checkbox_api.receipt.sell_batch(
+            [goods for _, goods in todo],
+            cashless=cashless,
+            session=session,
+            concurrency=concurrency,
+            receipt_ids=[receipt_id for receipt_id, _ in todo],
+        )
+        results.update(zip((receipt_id for receipt_id, _ in todo), sold))
+
+    queue = chat_id is not None and bool(offline("enabled"))
+    statuses = {
+        receipt_id: result_status(result, queue)
+        for receipt_id, result in results.items()
+    }
+    await db.run(set_status, statuses)
+
+    for receipt_id, status in statuses.items():
+        if status == QUEUED:
+            log.warning(
+                "receipt queued: %s %r", receipt_id, results[receipt_id]
+            )
+            results[receipt_id] = ReceiptQueued(receipt_id)
+
+    return [results[receipt_id] for receipt_id, _, _ in prepared]
+
+
+async def sell(
+    goods,
+    cashless=False,
+    *,
+    session=None,
+    transaction=None,
+    chat_id=None,
+):
+    (result,) = await sell_batch(
+        [goods],
+        cashless=cashless,
+        session=session,
+        transactions=[transaction],
+        concurrency=1,
+        chat_id=chat_id,
+    )
+    if isinstance(result, Exception):
+        raise result
+
+    return result
+
+
+def queued_receipts(limit):
+    session = db.Session()
+    return [
+        (receipt.id, receipt.goods, receipt.cashless, receipt.chat_id)
+        for receipt in session.query(db.Receipt)
+        .filter(
+            db.Receipt.status == QUEUED,
+            db.Receipt.next_try <= datetime.now(),
+        )
+        .order_by(db.Receipt.created)
+        .limit(limit)
+    ]
+
+
+def postpone(receipt_ids, max_delay):
+    session = db.Session()
+    for receipt in session.query(db.Receipt).filter(
+        db.Receipt.id.in_(receipt_ids)
+    ):
+        receipt.attempts += 1
+        receipt.next_try = datetime.now() + timedelta(
+            seconds=min(2**receipt.attempts, max_delay)
+        )
+    session.commit()
+
+
+async def notify(receipt_id, chat_id, error, *, session):
+    if error is not None:
+        text = f"Чек з черги не створено: {error!s}"
+        await outbox.push(
+            [chat_id], "error", key=f"queued:{receipt_id}", text=text
+        )
+        await outbox.enqueue(
+            auth.ADMIN,
+            "error",
+            key=f"queued:{receipt_id}",
+            exclude=chat_id,
+            text=text,
+        )
+        return
+
+    try:
+        receipt_url = await checkbox_api.receipt.wait_receipt_sign(
+            receipt_id,
+            session=session,
+        )
+        (
+            receipt_image,
+            receipt_text,
+        ) = await checkbox_api.receipt.get_receipt_extra(
+            receipt_id,
+            session=session,
+        )
+    except Exception:
+        log.exception("queued receipt %s", receipt_id)
+        await outbox.push(
+            [chat_id],
+            key=f"receipt:{receipt_id}",
+            text="🧾 Чек з черги успішно створено",
+        )
+        return
+
+    payload = dict(
+        key=f"receipt:{receipt_id}",
+        image=receipt_image,
+        receipt_id=receipt_id,
+        url=receipt_url,
+        text=receipt_text,
+    )
+    await outbox.push([chat_id], "receipt", **payload)
+    await outbox.enqueue(
+        auth.SUPERVISOR, "receipt", exclude=chat_id, **payload
+    )
+
+
+@aiohttp_session
+async def drain(bucket, *, session, batch_size=20, concurrency=2):
+    if not (queued := await db.run(queued_receipts, batch_size)):
+        return 0
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fiscalize(receipt_id, goods, cashless, _):
+        async with semaphore:
+            await bucket.acquire()
+            if not await checkbox_api.receipt.receipt_exists(
+                receipt_id, session=session
+            ):
+                await checkbox_api.receipt.sell(
+                    goods,
+                    cashless,
+                    session=session,
+                    receipt_id=receipt_id,
+                )
+
+    results = await asyncio.gather(
+        *(fiscalize(*receipt) for receipt in queued),
+        return_exceptions=True,
+    )
+
+    statuses = {}
+    postponed = []
+    for (receipt_id, *_), result in zip(queued, results):
+        if isinstance(result, OFFLINE):
+            postponed.append(receipt_id)
+        else:
+            statuses[receipt_id] = result_status(result)
+        drained.inc(status=statuses.get(receipt_id, "postponed"))
+
+    await db.run(set_status, statuses)
+    if postponed:
+        log.warning("checkbox offline, %d receipts postponed", len(postponed))
+        await db.run(postpone, postponed, offline("max_delay", 300))
+
+    for (receipt_id, _, _, chat_id), result in zip(queued, results):
+        if receipt_id in statuses:
+            await notify(
+                receipt_id,
+                chat_id,
+                result if isinstance(result, Exception) else None,
+                session=session,
+            )
+
+    return len(statuses)
+
+
+async def drainer():
+    if not offline("enabled"):
+        return
+
+    interval = offline("interval", 30)
+    bucket = TokenBucket(offline("rate", 1), offline("burst", 1))
+
+    while True:
+        try:
+            if await drain(
+                bucket,
+                batch_size=offline("batch_size", 20),
+                concurrency=offline("concurrency", 2),
+            ):
+                continue
+        except Exception:
+            log.exception("drainer error")
+
+        await asyncio.sleep(interval)
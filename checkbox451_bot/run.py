@@ -1,9 +1,6 @@
 import asyncio
-import time
 from logging import getLogger
 
-from requests import RequestException
-
 log = getLogger(__name__)
 
 
@@ -13,30 +10,32 @@ def main():
     log.info(f"{version=}")
 
     from checkbox451_bot import (
+        auth,
         checkbox_api,
         goods,
         gsheet,
         handlers,
+        metrics,
+        outbox,
+        receipts,
         shift_close,
     )
 
-    while True:
-        try:
-            goods.get_items()
-        except RequestException as e:
-            log.error(e)
-            time.sleep(60)
-            continue
-        break
+    loop = asyncio.get_event_loop()
 
     checkbox_api.receipt.get_receipt_params()
+    auth.RoleIndex().load()
 
-    loop = asyncio.get_event_loop()
+    loop.create_task(metrics.serve())
+    loop.create_task(goods.refresher())
+    loop.create_task(gsheet.gsheet.flush())
+    loop.create_task(outbox.sender())
+    loop.create_task(receipts.drainer())
     loop.create_task(gsheet.privat24.Privat24TransactionProcessor().run())
     loop.create_task(gsheet.fondy.FondyTransactionProcessor().run())
     loop.create_task(shift_close.scheduler())
 
-    handlers.start_polling()
+    handlers.start()
 
 
 if __name__ == "__main__":
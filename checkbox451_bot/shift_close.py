@@ -6,7 +6,7 @@ from typing import Any
 
 import schedule
 
-from checkbox451_bot import auth, checkbox_api
+from checkbox451_bot import auth, checkbox_api, outbox
 from checkbox451_bot.bot import Bot
 from checkbox451_bot.checkbox_api.helpers import aiohttp_session
 from checkbox451_bot.config import Config
@@ -17,12 +17,7 @@ log = logging.getLogger(__name__)
 
 
 async def error(msg):
-    await helpers.broadcast(
-        None,
-        auth.ADMIN,
-        helpers.error,
-        msg,
-    )
+    await outbox.enqueue(auth.ADMIN, "error", text=msg)
 
 
 def sync(coro):
@@ -38,6 +33,7 @@ async def shift_close(*, logger: Any = log, chat_id=None, session):
     shift = await checkbox_api.shift.current_shift(session=session)
     if shift is None:
         logger.info("shift is already closed")
+        checkbox_api.helpers.invalidate_state()
         checkbox_api.auth.sign_out()
         return
 
@@ -91,6 +87,9 @@ class Logger:
 async def main():
     async with Bot().session_close():
         await shift_close(logger=Logger)
+        await gsheet.flush()
+        while await outbox.deliver_due():
+            pass
 
 
 if __name__ == "__main__":
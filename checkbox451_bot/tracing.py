@@ -0,0 +1,179 @@
+import asyncio
+import json
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from logging import getLogger
+from pathlib import Path
+from typing import List, Optional
+
+import checkbox451_bot
+from checkbox451_bot.config import Config
+
+log = getLogger(__name__)
+
+_current: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracing")
+
+
+class Span:
+    def __init__(self, name, parent: "Span" = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = attributes
+        self.children: List[Span] = []
+        self.error: Optional[str] = None
+        self.start = time.time_ns()
+        self.end: Optional[int] = None
+
+        if parent:
+            parent.children.append(self)
+
+    @property
+    def duration(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def tree(self, depth=0):
+        line = f"{'  ' * depth}{self.name} {self.duration:.3f}s"
+        line += "".join(f" {k}={v}" for k, v in self.attributes.items())
+        if self.error:
+            line += f" ! {self.error}"
+        yield line
+
+        for child in sorted(self.children, key=lambda span: span.start):
+            yield from child.tree(depth + 1)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end or time.time_ns()),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            "status": (
+                {"code": 2, "message": self.error}
+                if self.error
+                else {"code": 1}
+            ),
+        }
+        if self.parent:
+            span["parentSpanId"] = self.parent.span_id
+
+        return span
+
+
+def annotate(**attributes):
+    if span_ := _current.get():
+        span_.attributes.update(attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    parent = _current.get()
+    current = Span(name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.end = time.time_ns()
+        _current.reset(token)
+        if parent is None:
+            finish(current)
+
+
+def traced(name=None):
+    def decorator(func):
+        module = func.__module__.removeprefix("checkbox451_bot.")
+        span_name = name or f"{module}.{func.__qualname__}"
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if name is None and _current.get() is None:
+                return await func(*args, **kwargs)
+
+            with span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def detached(aw):
+    _current.set(None)
+    return await aw
+
+
+def otlp(root: Span):
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {
+                            "key": "service.name",
+                            "value": {
+                                "stringValue": checkbox451_bot.__appname__
+                            },
+                        },
+                        {
+                            "key": "service.version",
+                            "value": {
+                                "stringValue": checkbox451_bot.__version__
+                            },
+                        },
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": __name__},
+                        "spans": [span_.to_otlp() for span_ in root.walk()],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def write(path, line):
+    with Path(path).open("a") as f:
+        f.write(line + "\n")
+
+
+def export(root: Span, path):
+    line = json.dumps(otlp(root), ensure_ascii=False)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        write(path, line)
+    else:
+        loop.run_in_executor(executor, write, path, line)
+
+
+def finish(root: Span):
+    threshold = Config().get("tracing", "slow_threshold", default=5)
+    if root.duration >= threshold:
+        log.warning("slow request:\n%s", "\n".join(root.tree()))
+
+    if path := Config().get("tracing", "file"):
+        export(root, path)
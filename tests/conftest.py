@@ -0,0 +1,96 @@
+import socket
+from contextlib import asynccontextmanager
+
+import pytest
+import yaml
+from aiohttp import web
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from checkbox451_bot import db, outbox
+from checkbox451_bot.bot import Bot
+from checkbox451_bot.checkbox_api import auth, helpers, retry
+from checkbox451_bot.config import Config
+from checkbox451_bot.ratelimit import limiter
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def serve_app(app, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        yield
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def serve():
+    return serve_app
+
+
+def reset():
+    Config.cache_clear()
+    Config.__wrapped__.get.cache_clear()
+    auth.TokenManager.cache_clear()
+    helpers.state.cache_clear()
+    retry.retry_policy.cache_clear()
+    retry._breakers.clear()
+    outbox.wakeup.cache_clear()
+    Bot.cache_clear()
+    limiter.cache_clear()
+
+
+@pytest.fixture
+def checkbox_config(tmp_path, monkeypatch):
+    port = free_port()
+
+    def configure(telegram_bot=None, google=None, **checkbox):
+        config = {
+            "checkbox": {
+                "api_url": f"http://127.0.0.1:{port}",
+                "pin": "0000",
+                "license": "test",
+                **checkbox,
+            },
+            "telegram_bot": {
+                "token": "123456:test",
+                "admins": [],
+                **(telegram_bot or {}),
+            },
+            "google": google or {},
+        }
+        (tmp_path / "config.yaml").write_text(yaml.safe_dump(config))
+
+        reset()
+        with monkeypatch.context() as m:
+            m.chdir(tmp_path)
+            Config()
+
+        return port
+
+    yield configure
+    reset()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args=dict(check_same_thread=False),
+    )
+    db.Base.metadata.create_all(engine)
+    session = scoped_session(sessionmaker(bind=engine))
+    monkeypatch.setattr(db, "Session", session)
+
+    yield session
+
+    session.remove()
+    engine.dispose()
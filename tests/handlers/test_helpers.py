@@ -1,6 +1,14 @@
+import asyncio
+from io import BytesIO
+from types import SimpleNamespace
+
 import pytest
+from aiogram.bot import api
 
-from checkbox451_bot.handlers.helpers import text_to_goods
+from checkbox451_bot.bot import Bot
+from checkbox451_bot.handlers import helpers
+from checkbox451_bot.handlers.helpers import GoodsParseError, text_to_goods
+from checkbox451_bot.ratelimit import limiter
 
 
 @pytest.mark.parametrize(
@@ -39,6 +47,17 @@ from checkbox451_bot.handlers.helpers import text_to_goods
                 },
             ],
         ),
+        (
+            "Сірники 0.29 грн 0,003",
+            [
+                {
+                    "name": "Сірники",
+                    "price": 29,
+                    "quantity": 3,
+                    "code": "Сірники 0.29",
+                },
+            ],
+        ),
         (
             "Цукор 25 грн 0.4  \n"
             "Сир кисломолочний 5% жиру 45.49 грн 2\n"
@@ -69,3 +88,95 @@ from checkbox451_bot.handlers.helpers import text_to_goods
 def test_text_to_goods(text, expected):
     goods = text_to_goods(text)
     assert goods == expected
+
+
+@pytest.mark.parametrize(
+    "text, lineno",
+    (
+        ("Консультація грн", 1),
+        ("Цукор 25 грн\nСир 45.49 грн 2 кг", 2),
+        ("Цукор 25 грн\n\nСир 45.49 грн", 2),
+    ),
+)
+def test_text_to_goods_error(text, lineno):
+    with pytest.raises(GoodsParseError) as exc_info:
+        text_to_goods(text)
+    assert exc_info.value.lineno == lineno
+
+
+class FakeBot:
+    def __init__(self):
+        self.uploads = 0
+        self.sent = []
+
+    async def send_photo(self, chat_id, photo):
+        await asyncio.sleep(0.01)
+        if isinstance(photo, BytesIO):
+            self.uploads += 1
+            photo = f"file{self.uploads}"
+        self.sent.append((chat_id, photo))
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=photo)])
+
+
+def test_send_receipt_photo_uploads_once(checkbox_config, monkeypatch):
+    checkbox_config()
+    bot = FakeBot()
+    monkeypatch.setattr(helpers, "Bot", lambda: bot)
+    helpers.receipt_photos.clear()
+
+    async def scenario():
+        await asyncio.gather(
+            *(
+                helpers.send_receipt_photo(chat_id, "r1", b"png")
+                for chat_id in range(5)
+            )
+        )
+        await helpers.send_receipt_photo(5, "r1", b"png")
+
+    asyncio.run(scenario())
+
+    assert bot.uploads == 1
+    assert sorted(bot.sent) == [(i, "file1") for i in range(6)]
+    assert helpers.receipt_uploads == {}
+    assert helpers.receipt_upload_waiters == {}
+
+
+def test_send_receipt_limits_each_call(checkbox_config, monkeypatch):
+    checkbox_config()
+    methods = []
+
+    async def make_request(session, server, token, method, data, *_, **__):
+        methods.append(method)
+        if method == "sendChatAction":
+            return True
+        return {
+            "message_id": len(methods),
+            "date": 0,
+            "chat": {"id": data["chat_id"], "type": "private"},
+            "photo": [
+                {
+                    "file_id": "f",
+                    "file_unique_id": "f",
+                    "width": 1,
+                    "height": 1,
+                }
+            ],
+        }
+
+    monkeypatch.setattr(api, "make_request", make_request)
+    helpers.receipt_photos.clear()
+
+    async def scenario():
+        async with Bot().session_close():
+            await Bot().send_chat_action(1, "upload_document")
+            await helpers.send_receipt(1, "r2", b"png", "https://url", "text")
+
+    asyncio.run(scenario())
+
+    assert methods == [
+        "sendChatAction",
+        "sendPhoto",
+        "sendMessage",
+        "sendMessage",
+    ]
+    assert limiter().sent == 3
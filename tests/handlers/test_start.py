@@ -0,0 +1,44 @@
+import asyncio
+
+from aiogram.utils import executor
+from aiohttp import web
+
+from checkbox451_bot import handlers
+
+
+def test_webhook_runs_on_default_loop(checkbox_config, monkeypatch):
+    checkbox_config(
+        telegram_bot={"webhook": {"url": "https://bot.example/hook"}}
+    )
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    ticks = []
+    served = []
+
+    async def startup(_):
+        pass
+
+    def run_app(app, *, loop=None, **_):
+        loop = loop or asyncio.new_event_loop()
+        before = len(ticks)
+        loop.run_until_complete(asyncio.sleep(0.01))
+        served.append(len(ticks) - before)
+
+    monkeypatch.setattr(executor.Executor, "_startup_webhook", startup)
+    monkeypatch.setattr(web, "run_app", run_app)
+
+    async def background():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    try:
+        task = loop.create_task(background())
+        handlers.start()
+        task.cancel()
+        loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    assert served[0] > 0
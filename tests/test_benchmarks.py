@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_benchmark_smoke():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench",
+            "--receipts=4",
+            "--cashiers=2",
+            "--transactions=6",
+            "--latency=0",
+            "--sign-delay=0",
+            "--telegram-latency=0",
+            "--sheets-latency=0",
+            "--json",
+        ],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        check=True,
+        text=True,
+        timeout=120,
+    )
+    results = json.loads(result.stdout)
+
+    assert results["sell"]["receipts"] == 4
+    for provider in ("privat24", "fondy"):
+        assert results[provider]["processed"] == 6
+        assert results[provider]["rows"] == 6
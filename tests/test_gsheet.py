@@ -1,9 +1,12 @@
-from datetime import datetime
+import asyncio
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
-from checkbox451_bot import gsheet
+from benchmarks.fake_services import FakeWorksheet
+from checkbox451_bot import db, gsheet
 from checkbox451_bot.gsheet.common import (
     TransactionBase,
     TransactionProcessorBase,
@@ -150,3 +153,327 @@ def test_transaction_to_goods(goods, transaction, receipt_goods):
     with patch("checkbox451_bot.goods.get_items", return_value=goods):
         transaction_to_goods = TransactionProcessorBase.transaction_to_goods
         assert transaction_to_goods(transaction) == receipt_goods
+
+
+@pytest.mark.parametrize(
+    ["goods", "match", "total", "receipt_goods"],
+    [
+        (
+            {
+                "Cabbage 200.00": {
+                    "code": "cbg200",
+                    "name": "Cabbage",
+                    "price": 20000,
+                },
+                "Potato 200.00": {
+                    "code": "pot200",
+                    "name": "Potato",
+                    "price": 20000,
+                },
+            },
+            "multiple",
+            "400.00",
+            ("pot200", 20000, 2000),
+        ),
+        (
+            {
+                "Cabbage 200.00": {
+                    "code": "cbg200",
+                    "name": "Cabbage",
+                    "price": 20000,
+                },
+            },
+            "exact",
+            "400.00",
+            ("c0de", 40000, 1000),
+        ),
+        (
+            {
+                f"Good {price / 100:.2f}": {
+                    "code": f"g{price}",
+                    "name": "Good",
+                    "price": price,
+                }
+                for price in range(1, 2000)
+            },
+            "multiple",
+            "1821.23",
+            ("g1", 1, 182123000),
+        ),
+        (
+            {
+                f"Good {price / 100:.2f}": {
+                    "code": f"g{price}",
+                    "name": "Good",
+                    "price": price,
+                }
+                for price in range(2, 2000, 2)
+            },
+            "multiple",
+            "1000.00",
+            ("g1250", 1250, 80000),
+        ),
+    ],
+)
+def test_transaction_to_goods_match(goods, match, total, receipt_goods):
+    transaction = TransactionBase(
+        ts=datetime.now(), code="c0de", name="Order", sum=total
+    )
+    with patch("checkbox451_bot.goods.get_items", return_value=goods):
+        transaction_to_goods = TransactionProcessorBase.transaction_to_goods
+        (good,) = transaction_to_goods(transaction, match=match)
+        assert (good["code"], good["price"], good["quantity"]) == receipt_goods
+
+
+@pytest.mark.parametrize(
+    ["order_status", "pending"],
+    [
+        ("created", True),
+        ("processing", True),
+        ("declined", False),
+        ("expired", False),
+        ("reversed", False),
+        ("unknown", False),
+    ],
+)
+def test_fondy_pending(order_status, pending):
+    transaction = gsheet.fondy.FondyTransaction.parse_obj(
+        {
+            "payment_id": "1",
+            "tran_time": "2024-01-01 10:00:00",
+            "order_id": "order_1",
+            "actual_amount": "100.00",
+            "sender_email": "",
+            "settlement_date": "2024-01-02",
+            "order_status": order_status,
+            "settlement_status": "",
+        }
+    )
+    assert transaction.pending() is pending
+
+
+class FakeManager:
+    def __init__(self, worksheet):
+        self.sheet = worksheet
+        self.opened = 0
+
+    async def authorize(self):
+        return self
+
+    async def open_by_key(self, _):
+        return self
+
+    async def worksheet(self, _):
+        self.opened += 1
+        return self.sheet
+
+
+class FailingWorksheet(FakeWorksheet):
+    def __init__(self, failures):
+        super().__init__(latency=0)
+        self.failures = failures
+
+    async def append_rows(self, rows, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sheets unavailable")
+        await super().append_rows(rows, **kwargs)
+
+
+@pytest.fixture
+def sheets(checkbox_config, database, monkeypatch):
+    checkbox_config(
+        google={
+            "spreadsheet_key": "test",
+            "flush": {"size": 3, "interval": 10, "max_delay": 300},
+        }
+    )
+    monkeypatch.setattr(gsheet.gsheet, "_worksheets", {})
+    monkeypatch.setattr(gsheet.gsheet, "_flush_timers", {})
+    monkeypatch.setattr(gsheet.gsheet, "_flush_failures", {})
+    gsheet.gsheet.flush_lock.cache_clear()
+
+    def use(worksheet):
+        manager = FakeManager(worksheet)
+        monkeypatch.setattr(gsheet.gsheet, "manager", lambda: manager)
+        return manager
+
+    yield use
+    gsheet.gsheet.flush_lock.cache_clear()
+
+
+def pending(title="sheet"):
+    return [row for _, row in gsheet.gsheet.pending_rows().get(title, [])]
+
+
+def test_append_row_buffers_until_size(sheets):
+    worksheet = FakeWorksheet(latency=0)
+    sheets(worksheet)
+
+    async def scenario():
+        await gsheet.gsheet.append_row(["a", 1], "sheet")
+        await gsheet.gsheet.append_row(["b", 2], "sheet")
+        assert not worksheet.rows
+        assert pending() == [["a", 1], ["b", 2]]
+        assert "sheet" in gsheet.gsheet._flush_timers
+
+        await gsheet.gsheet.append_row(["c", 3], "sheet")
+        gsheet.gsheet._flush_timers["sheet"].cancel()
+
+    asyncio.run(scenario())
+
+    assert worksheet.rows == [["a", 1], ["b", 2], ["c", 3]]
+    assert pending() == []
+
+
+def test_flush_failure_keeps_rows(sheets):
+    worksheet = FailingWorksheet(failures=1)
+    manager = sheets(worksheet)
+    gsheet.gsheet.store_row(["a", 1], "sheet")
+
+    async def scenario():
+        await gsheet.gsheet.flush()
+        assert pending() == [["a", 1]]
+        assert gsheet.gsheet._worksheets == {}
+        assert gsheet.gsheet._flush_failures == {"sheet": 1}
+
+        timer = gsheet.gsheet._flush_timers["sheet"]
+        timer.cancel()
+        await asyncio.gather(timer, return_exceptions=True)
+
+        await gsheet.gsheet.flush()
+
+    asyncio.run(scenario())
+
+    assert worksheet.rows == [["a", 1]]
+    assert pending() == []
+    assert manager.opened == 2
+    assert gsheet.gsheet._flush_failures == {}
+
+
+def test_concurrent_flush_writes_once(sheets):
+    worksheet = FakeWorksheet(latency=0.01)
+    sheets(worksheet)
+    for i in range(5):
+        gsheet.gsheet.store_row([i], "sheet")
+
+    async def scenario():
+        await asyncio.gather(gsheet.gsheet.flush(), gsheet.gsheet.flush())
+
+    asyncio.run(scenario())
+
+    assert worksheet.rows == [[i] for i in range(5)]
+    assert worksheet.calls == 1
+
+
+def test_delete_rows(database):
+    gsheet.gsheet.store_row(["a"], "one")
+    gsheet.gsheet.store_row(["b"], "two")
+    ((row_id, _),) = gsheet.gsheet.pending_rows("one")["one"]
+
+    gsheet.gsheet.delete_rows([row_id])
+
+    assert gsheet.gsheet.pending_rows() == {"two": [(row_id + 1, ["b"])]}
+
+
+@pytest.mark.parametrize(
+    ["failures", "delay"], [(1, 20), (2, 40), (4, 160), (5, 300), (10, 300)]
+)
+def test_flush_retry_delay(sheets, failures, delay):
+    assert gsheet.gsheet.retry_delay(failures) == delay
+
+
+class DummyTransaction(TransactionBase):
+    _id_key = "id"
+
+
+class DummyProcessor(TransactionProcessorBase):
+    transactions_file = Path("transactions-dummy.json")
+    transaction_cls = DummyTransaction
+
+    async def get_transactions(self, start_time):
+        return []
+
+
+def dummy(tr_id, ts, *, receipt=False, income=False):
+    transaction = DummyTransaction.parse_obj(
+        {"id": tr_id, "ts": ts, "code": "c", "name": "n", "sum": "1.00"}
+    )
+    transaction.set_db(
+        db.Transaction(
+            type="dummy", id=tr_id, ts=ts, receipt=receipt, income=income
+        )
+    )
+    return transaction
+
+
+def test_cursor(database):
+    processor = DummyProcessor(logger=None)
+    full_window = datetime.combine(date.today() - timedelta(days=7), time.min)
+    now = datetime.now().replace(microsecond=0)
+    older, newer = now - timedelta(hours=3), now - timedelta(hours=1)
+    database.add_all(
+        db.Transaction(type="dummy", id=tr_id, ts=ts)
+        for tr_id, ts in (("1", older), ("2", newer))
+    )
+    database.commit()
+
+    assert processor.start_time(session=database) == full_window
+
+    processor.update_cursor(
+        [dummy("1", older), dummy("2", newer, receipt=True, income=True)],
+        session=database,
+    )
+    assert processor.start_time(session=database) == older - timedelta(hours=1)
+
+    processor.update_cursor(
+        [
+            dummy("1", older, receipt=True, income=True),
+            dummy("2", newer, receipt=True, income=True),
+        ],
+        session=database,
+    )
+    assert processor.start_time(session=database) == newer - timedelta(hours=1)
+
+    database.merge(db.Cursor(type="dummy", ts=now - timedelta(days=30)))
+    database.commit()
+    assert processor.start_time(session=database) == full_window
+
+
+def test_parse_transaction(database):
+    processor = DummyProcessor(logger=None)
+    now = datetime.now().replace(microsecond=0)
+    database.add_all(
+        [
+            db.Transaction(
+                type="dummy", id="1", ts=now, receipt=True, income=True
+            ),
+            db.Transaction(type="dummy", id="2", ts=now, receipt=True),
+            db.Transaction(type="other", id="3", ts=now),
+        ]
+    )
+    database.commit()
+
+    def raw(tr_id, ts):
+        return {"id": tr_id, "ts": ts, "code": "c", "name": "n", "sum": "1.00"}
+
+    transactions = processor.parse_transaction(
+        [
+            # fully processed rows are skipped before validation
+            {"id": "1"},
+            raw("2", now - timedelta(hours=1)),
+            raw("3", now - timedelta(hours=2)),
+        ],
+        session=database,
+    )
+
+    assert [(tr.db.id, tr.db.receipt) for tr in transactions] == [
+        ("3", False),
+        ("2", True),
+    ]
+
+    known = processor.load_db(
+        ["1", "2", "3", "4"], session=database, chunk_size=2
+    )
+    assert sorted(known) == ["1", "2", "3"]
+    assert all(tr.type == "dummy" for tr in known.values())
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from aiogram.utils.exceptions import RetryAfter
+
+from checkbox451_bot import db, outbox
+
+
+def rows(database):
+    database.expire_all()
+    return {
+        message.chat_id: message
+        for message in database.query(db.OutboxMessage).order_by(
+            db.OutboxMessage.id
+        )
+    }
+
+
+def test_push_deduplicates_by_key(database):
+    async def scenario():
+        await outbox.push([1, 2], key="receipt:1", text="first")
+        await outbox.push([1, 2], key="receipt:1", text="second")
+
+    asyncio.run(scenario())
+
+    messages = rows(database)
+    assert sorted(messages) == [1, 2]
+    assert messages[1].key == "receipt:1:1"
+    assert messages[1].payload == {"text": "first"}
+
+
+def test_enqueue_role(database, monkeypatch):
+    monkeypatch.setattr(outbox.auth, "role_users", lambda _: [1, 2, 3])
+
+    asyncio.run(outbox.enqueue("SUPERVISOR", exclude=2, text="hello"))
+
+    assert sorted(rows(database)) == [1, 3]
+
+
+def test_enqueue_invalid_kind(database):
+    with pytest.raises(ValueError):
+        asyncio.run(outbox.push([1], "sticker"))
+
+
+def test_due_messages(database):
+    now = datetime.now()
+    for chat_id, delay in ((1, 0), (2, 60), (3, -60)):
+        database.add(
+            db.OutboxMessage(
+                chat_id=chat_id,
+                kind="message",
+                payload={"text": str(chat_id)},
+                attempts=0,
+                next_try=now + timedelta(seconds=delay),
+            )
+        )
+    database.commit()
+
+    due = outbox.due_messages(10)
+
+    assert [chat_id for _, chat_id, _, _ in due] == [1, 3]
+    assert outbox.due_messages(1)[0][1] == 1
+
+
+def test_finish(database):
+    database.add_all(
+        db.OutboxMessage(
+            chat_id=chat_id,
+            kind="message",
+            payload={},
+            attempts=attempts,
+            next_try=datetime.now(),
+        )
+        for chat_id, attempts in ((1, 0), (2, 0), (3, 2), (4, 9))
+    )
+    database.commit()
+    ids = {chat_id: message.id for chat_id, message in rows(database).items()}
+
+    outbox.finish([ids[1]], {ids[2]: 30, ids[3]: None, ids[4]: None})
+
+    messages = rows(database)
+    assert sorted(messages) == [2, 3]
+    assert messages[2].attempts == 1
+    assert messages[3].attempts == 3
+
+    now = datetime.now()
+    assert 29 < (messages[2].next_try - now).total_seconds() <= 30
+    assert 7 < (messages[3].next_try - now).total_seconds() <= 8
+
+
+def test_deliver_due_failures(database, monkeypatch):
+    async def send(chat_id, payload, _):
+        if chat_id == 1:
+            raise RetryAfter(5)
+        if chat_id == 2:
+            raise ConnectionError("telegram unavailable")
+
+    monkeypatch.setitem(outbox.senders, "message", send)
+
+    async def scenario():
+        await outbox.push([1, 2, 3], text="hello")
+        return await outbox.deliver_due()
+
+    assert asyncio.run(scenario()) == 1
+
+    messages = rows(database)
+    assert sorted(messages) == [1, 2]
+    assert messages[1].attempts == messages[2].attempts == 1
+
+    now = datetime.now()
+    assert 4 < (messages[1].next_try - now).total_seconds() <= 5
+    assert 1 < (messages[2].next_try - now).total_seconds() <= 2
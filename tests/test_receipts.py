@@ -0,0 +1,184 @@
+import asyncio
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_checkbox import FakeCheckbox
+from checkbox451_bot import db, receipts
+from checkbox451_bot.checkbox_api import receipt
+from checkbox451_bot.checkbox_api.helpers import close_client_session
+
+RECEIPT_ID = "0f0c4a8e-5d47-4b8c-9a6e-2d5e8e1f3a7b"
+
+
+def goods():
+    return [{"code": "1", "name": "Товар", "price": 10000, "quantity": 1000}]
+
+
+def run(serve, fake, port, scenario):
+    async def main():
+        async with serve(fake.app(), port):
+            try:
+                return await scenario()
+            finally:
+                await close_client_session()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def transaction(database):
+    database.add(
+        db.Transaction(
+            type="test",
+            id="1",
+            ts=datetime.now(),
+            notify=False,
+            receipt=False,
+            income=False,
+        )
+    )
+    database.commit()
+    return SimpleNamespace(type="test", id="1")
+
+
+def test_create_receipt_timeout_reconciled(checkbox_config, serve):
+    port = checkbox_config(
+        retry={"attempts": 2, "backoff": 0.01, "sell_timeout": 0.1}
+    )
+    fake = FakeCheckbox(latency=0, sign_delay=0, sell_delay=1)
+
+    receipt_id = run(
+        serve,
+        fake,
+        port,
+        lambda: receipt.create_receipt(goods(), receipt_id=RECEIPT_ID),
+    )
+
+    assert receipt_id == RECEIPT_ID
+    assert list(fake.receipts) == [RECEIPT_ID]
+    assert fake.sells == 2
+
+
+def test_sell_after_done(checkbox_config, serve, database, transaction):
+    port = checkbox_config()
+    fake = FakeCheckbox(latency=0, sign_delay=0)
+
+    async def scenario():
+        first = await receipts.sell(
+            goods(), cashless=True, transaction=transaction
+        )
+        second = await receipts.sell(
+            goods(), cashless=True, transaction=transaction
+        )
+        return first, second
+
+    first, second = run(serve, fake, port, scenario)
+
+    assert first == second
+    assert list(fake.receipts) == [first]
+    assert fake.sells == 1
+    assert database.get(db.Transaction, ("test", "1")).receipt
+    assert database.get(db.Receipt, first).status == receipts.DONE
+
+
+@pytest.mark.parametrize("accepted", [True, False])
+def test_sell_reuses_pending_receipt(
+    checkbox_config, serve, database, transaction, accepted
+):
+    port = checkbox_config()
+    fake = FakeCheckbox(latency=0, sign_delay=0)
+
+    async def scenario():
+        ((receipt_id, _, status),) = await db.run(
+            receipts.prepare, [goods()], True, [transaction]
+        )
+        assert status is None
+        if accepted:
+            fake.receipts[receipt_id] = time.monotonic(), {}
+
+        result = await receipts.sell(
+            goods(), cashless=True, transaction=transaction
+        )
+        assert result == receipt_id
+        return receipt_id
+
+    receipt_id = run(serve, fake, port, scenario)
+
+    assert list(fake.receipts) == [receipt_id]
+    assert fake.sells == (0 if accepted else 1)
+    assert database.get(db.Receipt, receipt_id).status == receipts.DONE
+
+
+def outbox_kinds(database, chat_id):
+    return [
+        message.kind
+        for message in database.query(db.OutboxMessage).filter(
+            db.OutboxMessage.chat_id == chat_id
+        )
+    ]
+
+
+def test_drain_after_outage(checkbox_config, serve, database):
+    port = checkbox_config(
+        retry={"attempts": 1},
+        breaker={"threshold": 1, "reset_timeout": 0.1},
+        offline={"enabled": True},
+    )
+    fake = FakeCheckbox(latency=0, sign_delay=0)
+    bucket = receipts.TokenBucket(100)
+
+    async def scenario():
+        with pytest.raises(receipts.ReceiptQueued) as queued:
+            await receipts.sell(goods(), chat_id=42)
+        receipt_id = queued.value.receipt_id
+
+        assert await receipts.drain(bucket) == 0
+        database.expire_all()
+        queued_receipt = database.get(db.Receipt, receipt_id)
+        assert queued_receipt.status == receipts.QUEUED
+        assert queued_receipt.attempts == 1
+        assert queued_receipt.next_try > datetime.now()
+
+        queued_receipt.next_try = datetime.now()
+        database.commit()
+
+        async with serve(fake.app(), port):
+            await asyncio.sleep(0.15)
+            try:
+                assert await receipts.drain(bucket) == 1
+            finally:
+                await close_client_session()
+
+        return receipt_id
+
+    receipt_id = asyncio.run(scenario())
+
+    database.expire_all()
+    assert database.get(db.Receipt, receipt_id).status == receipts.DONE
+    assert list(fake.receipts) == [receipt_id]
+    assert outbox_kinds(database, 42) == ["receipt"]
+
+
+def test_drain_failed(checkbox_config, serve, database):
+    port = checkbox_config(offline={"enabled": True})
+    fake = FakeCheckbox(latency=0, sign_delay=0)
+    bad_goods = [{**goods()[0], "price": 0}]
+
+    async def scenario():
+        ((receipt_id, _, _),) = await db.run(
+            receipts.prepare, [bad_goods], False, [None], 42
+        )
+        await db.run(receipts.set_status, {receipt_id: receipts.QUEUED})
+
+        assert await receipts.drain(receipts.TokenBucket(100)) == 1
+        return receipt_id
+
+    receipt_id = run(serve, fake, port, scenario)
+
+    database.expire_all()
+    assert database.get(db.Receipt, receipt_id).status == receipts.FAILED
+    assert not fake.receipts
+    assert outbox_kinds(database, 42) == ["error"]
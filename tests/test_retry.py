@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from benchmarks.fake_checkbox import FakeCheckbox
+from checkbox451_bot.checkbox_api.exceptions import (
+    CheckboxAPIError,
+    CheckboxUnavailableError,
+)
+from checkbox451_bot.checkbox_api.helpers import (
+    close_client_session,
+    endpoint,
+    get_retry,
+)
+from checkbox451_bot.checkbox_api.retry import (
+    CircuitBreaker,
+    RetryPolicy,
+    breaker,
+)
+
+
+def test_retry_budget():
+    policy = RetryPolicy(budget=2, budget_ratio=0.5)
+    assert policy.withdraw()
+    assert policy.withdraw()
+    assert not policy.withdraw()
+
+    policy.deposit()
+    policy.deposit()
+    assert policy.withdraw()
+    assert not policy.withdraw()
+
+
+def test_circuit_breaker():
+    circuit = CircuitBreaker("test", threshold=2, reset_timeout=0.05)
+    circuit.failure()
+    circuit.check()
+
+    circuit.failure()
+    with pytest.raises(CheckboxUnavailableError):
+        circuit.check()
+
+    time.sleep(0.06)
+    circuit.check()
+    circuit.success()
+    assert not circuit.is_open
+    assert circuit.failures == 0
+
+
+def flaky_app(hits, delay):
+    async def flaky(_):
+        hits.append(time.monotonic())
+        await asyncio.sleep(delay)
+        raise web.HTTPInternalServerError()
+
+    app = FakeCheckbox(latency=0).app()
+    app.router.add_get("/api/v1/flaky", flaky)
+    return app
+
+
+@pytest.mark.parametrize(
+    ["delay", "error"],
+    [(0, CheckboxAPIError), (1, asyncio.TimeoutError)],
+)
+def test_breaker_counts_requests(checkbox_config, serve, delay, error):
+    port = checkbox_config(
+        retry={"attempts": 3, "timeout": 0.1, "backoff": 0.01},
+        breaker={"threshold": 2},
+    )
+    hits = []
+
+    async def scenario():
+        async with serve(flaky_app(hits, delay), port):
+            try:
+                circuit = breaker(endpoint("/flaky"))
+
+                with pytest.raises(error):
+                    await get_retry("/flaky")
+                assert len(hits) == 3
+                assert circuit.failures == 1
+                assert not circuit.is_open
+
+                with pytest.raises(error):
+                    await get_retry("/flaky")
+                assert circuit.is_open
+
+                with pytest.raises(CheckboxUnavailableError):
+                    await get_retry("/flaky")
+                assert len(hits) == 6
+            finally:
+                await close_client_session()
+
+    asyncio.run(scenario())
+
+
+def test_retry_budget_limits_retries(checkbox_config, serve):
+    port = checkbox_config(
+        retry={"attempts": 3, "backoff": 0.01, "budget": 1, "budget_ratio": 0},
+        breaker={"threshold": 100},
+    )
+    hits = []
+
+    async def scenario():
+        async with serve(flaky_app(hits, 0), port):
+            try:
+                with pytest.raises(CheckboxAPIError):
+                    await get_retry("/flaky")
+                assert len(hits) == 2
+
+                with pytest.raises(CheckboxAPIError):
+                    await get_retry("/flaky")
+                assert len(hits) == 3
+            finally:
+                await close_client_session()
+
+    asyncio.run(scenario())
@@ -0,0 +1,52 @@
+import asyncio
+
+from checkbox451_bot import tracing
+
+
+def test_roots_only_for_named_spans(monkeypatch):
+    roots = []
+    monkeypatch.setattr(tracing, "finish", roots.append)
+
+    @tracing.traced()
+    async def call():
+        await asyncio.sleep(0)
+
+    @tracing.traced("handler")
+    async def handler():
+        await call()
+        await call()
+
+    async def scenario():
+        await call()
+        await handler()
+
+    asyncio.run(scenario())
+
+    (root,) = roots
+    assert root.name == "handler"
+    assert [child.name for child in root.children] == [
+        f"{call.__module__}.{call.__qualname__}"
+    ] * 2
+
+
+def test_detached_task_has_no_parent(monkeypatch):
+    roots = []
+    monkeypatch.setattr(tracing, "finish", roots.append)
+    parents = []
+
+    async def background():
+        await asyncio.sleep(0.01)
+        parents.append(tracing._current.get())
+
+    @tracing.traced("handler")
+    async def handler():
+        return asyncio.ensure_future(tracing.detached(background()))
+
+    async def scenario():
+        await (await handler())
+
+    asyncio.run(scenario())
+
+    (root,) = roots
+    assert parents == [None]
+    assert root.children == []